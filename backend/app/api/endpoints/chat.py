@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional, Tuple
 from fastapi.responses import StreamingResponse
-from app.core.rag.vector_store import VectorStoreManager
-from app.core.rag.rag_chain import RAGChain
+from app.core.config import settings
+from app.core.rag.vector_store import aget_vector_store_manager
+from app.core.rate_limiter import (
+    PRIORITY_INTERACTIVE, RateLimitExceeded, RequestExceedsBudget, estimate_tokens, get_scheduler,
+    request_user_id
+)
 
 router = APIRouter()
 
@@ -14,9 +18,94 @@ class Message(BaseModel):
 class QueryRequest(BaseModel):
     question: str
     chat_history: Optional[List[Message]] = None
+    retrieval_mode: Optional[Literal["single", "multi_query"]] = None  # Defaults to settings.RETRIEVAL_MODE
+    answer_mode: Optional[Literal["standard", "map_reduce"]] = None  # map_reduce: cross-file questions
+    document_ids: Optional[List[int]] = None  # map_reduce: files to answer from (default: best matching files)
+
+# Rough size of a HyDE passage embedded alongside the question in multi_query mode
+HYDE_TOKENS = 300
+# Rewritten search query, and the fixed instructions of a rewrite/HyDE prompt
+REWRITE_TOKENS = 100
+AUXILIARY_PROMPT_TOKENS = 150
+
+def _chat_demand(request: QueryRequest) -> Tuple[int, int]:
+    """(tokens, calls) of chat-model usage one answer needs."""
+    question_tokens = estimate_tokens(request.question)
+    history_tokens = estimate_tokens("".join(msg.content for msg in request.chat_history or []))
+    if request.answer_mode != "map_reduce":
+        return question_tokens + history_tokens + settings.CHAT_TOKENS_PER_REQUEST, 1
+    groups = settings.MAP_REDUCE_MAX_GROUPS
+    if request.document_ids:
+        groups = min(groups, len(request.document_ids))
+    # Map calls see the question and one file's context; the reduce call sees
+    # the history plus every partial answer.
+    map_tokens = question_tokens + settings.MAP_REDUCE_TOKEN_BUDGET + settings.MAP_REDUCE_COMPLETION_TOKENS
+    reduce_tokens = (
+        question_tokens + history_tokens
+        + groups * settings.MAP_REDUCE_COMPLETION_TOKENS
+        + settings.CHAT_TOKENS_PER_REQUEST
+    )
+    return groups * map_tokens + reduce_tokens, groups + 1
+
+def _embedding_demand(request: QueryRequest) -> Tuple[int, int]:
+    """(tokens, requests) of query embeddings one answer needs."""
+    # Upper bound on the search query (question plus recent history)
+    query_tokens = estimate_tokens(
+        request.question + "".join(msg.content for msg in request.chat_history or [])
+    )
+    mode = request.retrieval_mode or settings.RETRIEVAL_MODE
+    if request.answer_mode == "map_reduce" or not request.chat_history or mode != "multi_query":
+        return query_tokens, 1
+    # Question + rewrite (+ HyDE) in one batch, plus the single-query fallback
+    tokens = 3 * query_tokens + (HYDE_TOKENS if settings.MULTI_QUERY_HYDE else 0)
+    return tokens, 2
+
+def _auxiliary_demand(request: QueryRequest) -> Tuple[int, int]:
+    """(tokens, calls) of AUXILIARY_LLM_MODEL usage (query rewrite, HyDE) one answer needs."""
+    mode = request.retrieval_mode or settings.RETRIEVAL_MODE
+    if request.answer_mode == "map_reduce" or not request.chat_history or mode != "multi_query":
+        return 0, 0
+    question_tokens = estimate_tokens(request.question)
+    # The rewrite prompt sees the last 6 messages, each cut to 500 characters
+    history_tokens = estimate_tokens("".join(msg.content[:500] for msg in request.chat_history[-6:]))
+    tokens = AUXILIARY_PROMPT_TOKENS + question_tokens + history_tokens + REWRITE_TOKENS
+    calls = 1
+    if settings.MULTI_QUERY_HYDE:
+        tokens += AUXILIARY_PROMPT_TOKENS + question_tokens + HYDE_TOKENS
+        calls += 1
+    return tokens, calls
+
+async def _acquire_query_budget(request: QueryRequest, http_request: Request):
+    """Reserve chat, auxiliary and query-embedding capacity before streaming.
+
+    Raises 429 with Retry-After when saturated, and 413 when one answer needs
+    more than a whole minute of a budget. Nothing stays reserved when either
+    is raised.
+    """
+    scheduler = get_scheduler()
+    chat_tokens, calls = _chat_demand(request)
+    auxiliary_tokens, auxiliary_calls = _auxiliary_demand(request)
+    embedding_tokens, embedding_requests = _embedding_demand(request)
+    demands = [("chat", chat_tokens, calls), ("embedding", embedding_tokens, embedding_requests)]
+    if auxiliary_calls:
+        demands.insert(1, ("auxiliary", auxiliary_tokens, auxiliary_calls))
+    try:
+        await scheduler.acquire_many(
+            demands,
+            priority=PRIORITY_INTERACTIVE,
+            user_id=request_user_id(http_request)
+        )
+    except RequestExceedsBudget as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": e.retry_after_header}
+        )
 
 @router.post("/query")
-async def query_document(request: QueryRequest):
+async def query_document(request: QueryRequest, http_request: Request):
     """
     RAG Query with Conversation History, Chain of Thought, and Few Shot Learning
     
@@ -24,20 +113,32 @@ async def query_document(request: QueryRequest):
     - Uses step-by-step reasoning
     - Includes example patterns for better responses
     """
+    await _acquire_query_budget(request, http_request)
     try:
-        vector_manager = VectorStoreManager()
+        # Imported lazily: the chain pulls in langchain_openai on first query.
+        from app.core.rag.rag_chain import RAGChain
+
+        vector_manager = await aget_vector_store_manager()
         retriever = vector_manager.get_retriever()
-        rag_chain = RAGChain(retriever)
+        rag_chain = RAGChain(retriever, vector_manager)
         
         # Convert history to dict format
         history = None
         if request.chat_history:
             history = [{"role": msg.role, "content": msg.content} for msg in request.chat_history]
         
+        if request.answer_mode == "map_reduce":
+            return StreamingResponse(
+                rag_chain.astream_answer_map_reduce(request.question, history, request.document_ids),
+                media_type="text/event-stream"
+            )
+        
         # Use enhanced streaming with history if history exists
         if history:
             return StreamingResponse(
-                rag_chain.astream_answer_with_history(request.question, history),
+                rag_chain.astream_answer_with_history(
+                    request.question, history, request.retrieval_mode
+                ),
                 media_type="text/event-stream"
             )
         else:
@@ -52,10 +153,14 @@ async def query_document(request: QueryRequest):
 
 
 @router.post("/query/simple")
-async def query_document_simple(request: QueryRequest):
+async def query_document_simple(request: QueryRequest, http_request: Request):
     """Simple query without history for quick testing"""
+    await _acquire_query_budget(request, http_request)
     try:
-        vector_manager = VectorStoreManager()
+        # Imported lazily: the chain pulls in langchain_openai on first query.
+        from app.core.rag.rag_chain import RAGChain
+
+        vector_manager = await aget_vector_store_manager()
         retriever = vector_manager.get_retriever()
         rag_chain = RAGChain(retriever)
         
@@ -1,14 +1,30 @@
-import shutil
+import asyncio
 import os
+import math
+import hashlib
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Sequence, Tuple
 from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+import aiofiles
+import aiofiles.os
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
 
+from app.core.config import settings
 from app.db import models
 from app.db.database import get_db
 from app.core.rag.document_loader import UniversalDocumentLoader
-from app.core.rag.vector_store import VectorStoreManager
+from app.core.rag.conversation_ingest import ConversationIngestor
+from app.core.rag.vector_store import index_writer
+from app.core.rag.tabular_store import get_tabular_store
+from app.core.rate_limiter import (
+    PRIORITY_BULK, RateLimitExceeded, RequestExceedsBudget, estimate_tokens, get_scheduler,
+    request_user_id
+)
 
 
 class TextDocumentRequest(BaseModel):
@@ -17,31 +33,340 @@ class TextDocumentRequest(BaseModel):
     source_type: Optional[str] = "text"
     metadata: Optional[Dict[str, Any]] = None
 
+
+class TableQueryRequest(BaseModel):
+    table_name: str
+    operation: str  # "missing_rates", "value_counts", "group_by" or "profile"
+    column: Optional[str] = None
+    by: Optional[str] = None
+    agg: Optional[str] = "count"
+    limit: Optional[int] = 50
+
+
+class CanvasNodePayload(BaseModel):
+    id: str
+    parent_id: Optional[str] = None
+    type: str = "user"  # "user", "assistant" or "system"
+    content: str
+
+
+class ConversationIngestRequest(BaseModel):
+    canvas_id: str
+    canvas_name: Optional[str] = None
+    # New or changed nodes; unchanged nodes may be omitted (see the manifest endpoint)
+    nodes: List[CanvasNodePayload] = []
+    deleted_node_ids: List[str] = []
+
 router = APIRouter()
-vector_store_manager = VectorStoreManager()
 
 UPLOAD_DIR = "./data/documents"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/upload")
+# Texts per embeddings API request (OpenAIEmbeddings default chunk_size)
+EMBEDDING_BATCH_SIZE = 1000
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Completion tokens reserved per Canvas branch summary (prompt asks for 10 sentences)
+SUMMARY_COMPLETION_TOKENS = 500
+
+# Allowance for multipart boundaries and part headers on top of the file size
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+def _reserve_path(filename: str) -> Tuple[str, str]:
+    """Atomically claim a free file name in UPLOAD_DIR (adds _1, _2, ... on collision).
+
+    An empty placeholder is created with O_EXCL so concurrent uploads with the
+    same name always end up in different files.
+    """
+    base_name, ext = os.path.splitext(os.path.basename(filename))
+    candidate = base_name + ext
+    counter = 1
+    while True:
+        file_path = os.path.join(UPLOAD_DIR, candidate)
+        try:
+            os.close(os.open(file_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return candidate, file_path
+        except FileExistsError:
+            candidate = f"{base_name}_{counter}{ext}"
+            counter += 1
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the maximum upload size of {settings.MAX_UPLOAD_SIZE_BYTES} bytes"
+    )
+
+
+async def _write_atomically(file_path: str, chunks: AsyncIterator[bytes]) -> Tuple[int, str]:
+    """Stream chunks to a temp file, then rename it over file_path.
+
+    Returns (size, sha256) computed while writing. Raises 413 as soon as the
+    size limit is exceeded; the partial temp file is removed on any failure.
+    """
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_SIZE_BYTES:
+                    raise _too_large()
+                digest.update(chunk)
+                await out.write(chunk)
+        await aiofiles.os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
+    return size, digest.hexdigest()
+
+
+class _MultipartFileStream:
+    """Incremental multipart/form-data parser over request.stream().
+
+    Exposes one file field as an async byte stream, so the upload is parsed
+    while it arrives and written to disk once, without Starlette spooling the
+    whole body to a temporary file first.
+    """
+
+    def __init__(self, request: Request, field: str = "file"):
+        content_type, params = parse_options_header(request.headers.get("content-type", "").encode("latin-1"))
+        if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+            raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+        self._field = field
+        self._body = request.stream()
+        self._received = 0
+        self._finished = False
+        self._events: Deque[Tuple[str, Any]] = deque()
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._in_file = False
+        self._parser = MultipartParser(params[b"boundary"], callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+
+    # Parser callbacks (synchronous; they only queue events)
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode("utf-8", "replace") == self._field and b"filename" in options:
+            self._in_file = True
+            self._events.append(("start", (
+                options[b"filename"].decode("utf-8", "replace"),
+                self._headers.get(b"content-type", b"").decode("latin-1") or None,
+            )))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._events.append(("data", bytes(data[start:end])))
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._events.append(("end", None))
+
+    async def _feed(self):
+        """Parse the next chunk of the request body."""
+        if self._finished:
+            raise HTTPException(status_code=400, detail=f"Multipart body has no complete '{self._field}' file")
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            chunk = b""
+        self._received += len(chunk)
+        if self._received > settings.MAX_UPLOAD_SIZE_BYTES + MULTIPART_OVERHEAD_BYTES:
+            raise _too_large()
+        try:
+            if chunk:
+                self._parser.write(chunk)
+            else:
+                self._finished = True
+                self._parser.finalize()
+        except MultipartParseError as e:
+            raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+
+    async def open(self):
+        """Read until the file part starts; sets filename and content_type."""
+        while True:
+            while self._events:
+                kind, payload = self._events.popleft()
+                if kind == "start":
+                    self.filename, self.content_type = payload
+                    return
+            await self._feed()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Content of the file part, as it arrives."""
+        while True:
+            while self._events:
+                kind, payload = self._events.popleft()
+                if kind == "end":
+                    return
+                yield payload
+            await self._feed()
+
+
+async def _iter_bytes(data: bytes) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), UPLOAD_CHUNK_SIZE):
+        yield data[start:start + UPLOAD_CHUNK_SIZE]
+
+
+def _embedding_batches(documents: List) -> List[List]:
+    """Split chunks into embeddings requests that each fit the per-minute token budget."""
+    capacity = get_scheduler().capacity("embedding")
+    token_limit = capacity[1] if capacity else math.inf
+    batches, batch, batch_tokens = [], [], 0
+    for doc in documents:
+        tokens = estimate_tokens(doc.page_content)
+        if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or batch_tokens + tokens > token_limit):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(doc)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def _acquire_embedding_budget(batch: List, http_request: Request):
+    """Reserve embedding capacity for one batch; bulk work yields to interactive queries."""
+    await get_scheduler().acquire(
+        "embedding",
+        sum(estimate_tokens(doc.page_content) for doc in batch),
+        priority=PRIORITY_BULK,
+        user_id=request_user_id(http_request),
+        max_wait=settings.BULK_RATE_LIMIT_MAX_WAIT_SECONDS
+    )
+
+
+def _index_documents(documents: List, stale_filters: Sequence[dict] = ()):
+    """Embed and store chunks (serialized across workers in multi-worker mode).
+
+    Vectors matching stale_filters are dropped in the same write.
+    """
+    with index_writer() as vector_store_manager:
+        for where in stale_filters:
+            vector_store_manager.delete_where(where)
+        vector_store_manager.add_documents(documents)
+
+
+async def _index_in_batches(documents: List, http_request: Request, stale_filters: Sequence[dict] = ()):
+    """Index chunks batch by batch, reserving embedding budget right before each batch."""
+    batches = _embedding_batches(documents)
+    if not batches:
+        if stale_filters:
+            await asyncio.to_thread(_index_documents, [], stale_filters)
+        return
+    for index, batch in enumerate(batches):
+        await _acquire_embedding_budget(batch, http_request)
+        await asyncio.to_thread(_index_documents, batch, stale_filters if index == 0 else ())
+
+
+def _discard_indexed_data(document_id: int):
+    """Drop vectors and tables already written for a document whose ingestion was aborted."""
+    try:
+        with index_writer() as vector_store_manager:
+            vector_store_manager.delete_by_document_id(document_id)
+        get_tabular_store().delete_by_document_id(document_id)
+    except Exception as e:
+        print(f"Warning: Could not discard partially indexed document {document_id}: {e}")
+
+
+def _discard_document(db: Session, db_doc: models.Document):
+    """Remove a document that was rejected before indexing so the client can retry cleanly."""
+    if db_doc.file_path and os.path.exists(db_doc.file_path):
+        os.remove(db_doc.file_path)
+    db.delete(db_doc)
+    db.commit()
+
+
+def _rate_limited(e: Exception) -> HTTPException:
+    if isinstance(e, RequestExceedsBudget):
+        # A single chunk larger than a whole minute of embedding budget
+        return HTTPException(status_code=413, detail=str(e))
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": e.retry_after_header}
+    )
+
+@router.post("/upload", openapi_extra=UPLOAD_OPENAPI)
 async def upload_document(
-    file: UploadFile = File(...),
+    http_request: Request,
     db: Session = Depends(get_db)
 ):
+    """Upload a file (multipart field "file"), parsed and written to disk as it streams in."""
     try:
-        # Save file locally
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Reject before reading the body when the client declares an oversized upload
+        content_length = http_request.headers.get("content-length")
+        if content_length and content_length.isdigit() and (
+            int(content_length) > settings.MAX_UPLOAD_SIZE_BYTES + MULTIPART_OVERHEAD_BYTES
+        ):
+            raise _too_large()
+
+        upload = _MultipartFileStream(http_request)
+        await upload.open()
+        if not upload.filename:
+            raise HTTPException(status_code=400, detail="Uploaded file has no name")
+
+        # Save file locally (streamed, hashed on the fly)
+        filename, file_path = _reserve_path(upload.filename)
+        try:
+            file_size, sha256 = await _write_atomically(file_path, upload.chunks())
+        except BaseException:
+            os.remove(file_path)
+            raise
 
         # Create DB record
         db_doc = models.Document(
             user_id=1,  # Temporary hardcoded user for MVP
-            filename=file.filename,
-            original_filename=file.filename,
+            filename=filename,
+            original_filename=upload.filename,
             file_path=file_path,
-            file_type=file.content_type or "unknown",
-            file_size=os.path.getsize(file_path),
+            file_type=upload.content_type or "unknown",
+            file_size=file_size,
             status="processing"
         )
         db.add(db_doc)
@@ -50,26 +375,42 @@ async def upload_document(
 
         # Load and Index
         try:
-            documents = UniversalDocumentLoader.load(file_path)
+            documents, frames = await asyncio.to_thread(UniversalDocumentLoader.load_with_tables, file_path)
             # Add metadata
             for doc in documents:
                 doc.metadata["document_id"] = db_doc.id
-                doc.metadata["filename"] = file.filename
+                doc.metadata["filename"] = filename
+            
+            # Spreadsheets are also kept as tables for exact aggregations
+            if frames:
+                await asyncio.to_thread(get_tabular_store().store_workbook, db_doc.id, filename, frames)
             
-            vector_store_manager.add_documents(documents)
+            await _index_in_batches(documents, http_request)
             
             # Update status
             db_doc.status = "completed"
             db_doc.chunk_count = len(documents)
             db.commit()
             
+        except (RateLimitExceeded, RequestExceedsBudget) as e:
+            await asyncio.to_thread(_discard_indexed_data, db_doc.id)
+            _discard_document(db, db_doc)
+            raise _rate_limited(e)
         except Exception as e:
             db_doc.status = "failed"
             db.commit()
             raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
-        return {"filename": file.filename, "status": "success", "id": db_doc.id}
+        return {
+            "filename": filename,
+            "status": "success",
+            "id": db_doc.id,
+            "file_size": file_size,
+            "sha256": sha256
+        }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -77,6 +418,7 @@ async def upload_document(
 @router.post("/upload-text")
 async def upload_text_document(
     request: TextDocumentRequest,
+    http_request: Request,
     db: Session = Depends(get_db)
 ):
     """Upload text content as a document (e.g., from Canvas chat export)"""
@@ -86,19 +428,17 @@ async def upload_text_document(
         if not filename.endswith('.md'):
             filename = filename + '.md'
 
-        # Save content as .md file
-        file_path = os.path.join(UPLOAD_DIR, filename)
+        data = request.content.encode('utf-8')
+        if len(data) > settings.MAX_UPLOAD_SIZE_BYTES:
+            raise _too_large()
 
-        # Handle duplicate filenames
-        base_name = filename[:-3]  # Remove .md
-        counter = 1
-        while os.path.exists(file_path):
-            filename = f"{base_name}_{counter}.md"
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            counter += 1
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(request.content)
+        # Save content as .md file (duplicate filenames get a _N suffix)
+        filename, file_path = _reserve_path(filename)
+        try:
+            file_size, sha256 = await _write_atomically(file_path, _iter_bytes(data))
+        except BaseException:
+            os.remove(file_path)
+            raise
 
         # Create DB record
         db_doc = models.Document(
@@ -107,7 +447,7 @@ async def upload_text_document(
             original_filename=request.filename,
             file_path=file_path,
             file_type="text/markdown",
-            file_size=len(request.content.encode('utf-8')),
+            file_size=file_size,
             status="processing"
         )
         db.add(db_doc)
@@ -125,13 +465,17 @@ async def upload_text_document(
                 if request.metadata:
                     doc.metadata.update(request.metadata)
 
-            vector_store_manager.add_documents(documents)
+            await _index_in_batches(documents, http_request)
 
             # Update status
             db_doc.status = "completed"
             db_doc.chunk_count = len(documents)
             db.commit()
 
+        except (RateLimitExceeded, RequestExceedsBudget) as e:
+            await asyncio.to_thread(_discard_indexed_data, db_doc.id)
+            _discard_document(db, db_doc)
+            raise _rate_limited(e)
         except Exception as e:
             db_doc.status = "failed"
             db.commit()
@@ -142,7 +486,9 @@ async def upload_text_document(
             "status": "success",
             "id": db_doc.id,
             "source_type": request.source_type,
-            "chunk_count": db_doc.chunk_count
+            "chunk_count": db_doc.chunk_count,
+            "file_size": file_size,
+            "sha256": sha256
         }
 
     except HTTPException:
@@ -151,11 +497,145 @@ async def upload_text_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/conversations/ingest")
+async def ingest_conversation(
+    request: ConversationIngestRequest,
+    http_request: Request,
+    db: Session = Depends(get_db)
+):
+    """Incrementally index a Canvas conversation tree keyed by node id.
+
+    Only nodes that are new or changed since the last ingest of the same
+    canvas are embedded, and rolling per-branch summaries are extended
+    rather than regenerated.
+    """
+    payload_size = sum(len(node.content.encode('utf-8')) for node in request.nodes)
+    if payload_size > settings.MAX_UPLOAD_SIZE_BYTES:
+        raise _too_large()
+
+    try:
+        file_path = f"canvas://{request.canvas_id}"
+        db_doc = db.query(models.Document).filter(models.Document.file_path == file_path).first()
+        if db_doc is None:
+            db_doc = models.Document(
+                user_id=1,  # Temporary hardcoded user for MVP
+                filename=request.canvas_name or request.canvas_id,
+                original_filename=request.canvas_name or request.canvas_id,
+                file_path=file_path,
+                file_type="application/x-canvas-conversation",
+                file_size=0,
+                status="processing"
+            )
+            db.add(db_doc)
+            db.commit()
+            db.refresh(db_doc)
+        elif request.canvas_name:
+            db_doc.original_filename = request.canvas_name
+
+        ingestor = ConversationIngestor(db, db_doc, request.canvas_id, db_doc.original_filename)
+        unchanged = ingestor.apply_changes(
+            [
+                {"id": node.id, "parent_id": node.parent_id, "role": node.type, "content": node.content}
+                for node in request.nodes
+            ],
+            request.deleted_node_ids
+        )
+
+        if ingestor.stale_summaries():
+            # Imported lazily like the RAG chain: pulls in langchain_openai
+            from langchain_openai import ChatOpenAI
+
+            summary_llm = ChatOpenAI(
+                openai_api_key=settings.OPENAI_API_KEY,
+                model=settings.AUXILIARY_LLM_MODEL,
+                temperature=0
+            )
+            user_id = request_user_id(http_request)
+
+            async def acquire_summary_budget(prompt: str):
+                await get_scheduler().acquire(
+                    "auxiliary",
+                    estimate_tokens(prompt) + SUMMARY_COMPLETION_TOKENS,
+                    priority=PRIORITY_BULK,
+                    user_id=user_id,
+                    max_wait=settings.BULK_RATE_LIMIT_MAX_WAIT_SECONDS
+                )
+
+            await ingestor.update_summaries(summary_llm, acquire_summary_budget)
+
+        documents = ingestor.build_documents()
+        stale_filters = ingestor.stale_vector_filters()
+        if documents or stale_filters:
+            await _index_in_batches(documents, http_request, stale_filters)
+        ingestor.mark_indexed()
+
+        db_doc.status = "completed"
+        db_doc.chunk_count = ingestor.vector_count()
+        db_doc.file_size = sum(len(node.content.encode('utf-8')) for node in ingestor.nodes.values())
+        db.commit()
+
+    except (RateLimitExceeded, RequestExceedsBudget) as e:
+        db.rollback()
+        raise _rate_limited(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+
+    return {
+        "canvas_id": request.canvas_id,
+        "status": "success",
+        "id": db_doc.id,
+        "nodes_received": len(request.nodes),
+        "nodes_unchanged": unchanged,
+        "nodes_embedded": len(ingestor.changed),
+        "nodes_deleted": len(ingestor.deleted),
+        "summaries_updated": len(ingestor.updated_summaries),
+        "vectors_added": len(documents)
+    }
+
+
+@router.get("/conversations/{canvas_id}/manifest")
+def conversation_manifest(canvas_id: str, db: Session = Depends(get_db)):
+    """Content hashes of the last ingested nodes, so clients can send only changes.
+
+    Hash: sha256 of "{parent_id or ''}\\0{type}\\0{content}" (UTF-8).
+    """
+    nodes = db.query(models.CanvasNode).filter(models.CanvasNode.canvas_id == canvas_id).all()
+    return {
+        "canvas_id": canvas_id,
+        "nodes": {node.node_id: node.content_hash for node in nodes}
+    }
+
+
 @router.get("/")
 def list_documents(db: Session = Depends(get_db)):
     docs = db.query(models.Document).all()
     return docs
 
+@router.get("/tables")
+def list_tables(document_id: Optional[int] = None):
+    """List spreadsheet tables and their schema metadata"""
+    return get_tabular_store().list_tables(document_id)
+
+@router.post("/tables/query")
+def query_table(request: TableQueryRequest):
+    """Run an exact aggregation on a spreadsheet table"""
+    store = get_tabular_store()
+    try:
+        if request.operation == "missing_rates":
+            return store.missing_rates(request.table_name)
+        if request.operation == "value_counts":
+            return store.value_counts(request.table_name, request.column, request.limit)
+        if request.operation == "group_by":
+            return store.group_by(request.table_name, request.by, request.column, request.agg, request.limit)
+        if request.operation == "profile":
+            return {"markdown": store.profile(request.table_name)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    raise HTTPException(status_code=400, detail=f"Unsupported operation: {request.operation}")
+
 @router.delete("/{document_id}")
 def delete_document(document_id: int, db: Session = Depends(get_db)):
     """Delete a document by ID (file, database record, and vectors)"""
@@ -167,21 +647,30 @@ def delete_document(document_id: int, db: Session = Depends(get_db)):
     # 1. Delete vectors from ChromaDB
     deleted_vectors = 0
     try:
-        deleted_vectors = vector_store_manager.delete_by_document_id(document_id)
-        # Also try by filename as fallback
-        if deleted_vectors == 0 and doc.filename:
-            deleted_vectors = vector_store_manager.delete_by_filename(doc.filename)
+        with index_writer() as vector_store_manager:
+            deleted_vectors = vector_store_manager.delete_by_document_id(document_id)
+            # Also try by filename as fallback
+            if deleted_vectors == 0 and doc.filename:
+                deleted_vectors = vector_store_manager.delete_by_filename(doc.filename)
     except Exception as e:
         print(f"Warning: Could not delete vectors: {e}")
     
-    # 2. Delete file from disk
+    # 2. Drop spreadsheet tables
+    try:
+        get_tabular_store().delete_by_document_id(document_id)
+    except Exception as e:
+        print(f"Warning: Could not delete tables: {e}")
+    
+    # 3. Delete file from disk
     try:
         if doc.file_path and os.path.exists(doc.file_path):
             os.remove(doc.file_path)
     except Exception as e:
         print(f"Warning: Could not delete file {doc.file_path}: {e}")
     
-    # 3. Delete from database
+    # 4. Delete from database (including Canvas conversation state)
+    db.query(models.CanvasNode).filter(models.CanvasNode.document_id == document_id).delete()
+    db.query(models.CanvasBranchSummary).filter(models.CanvasBranchSummary.document_id == document_id).delete()
     db.delete(doc)
     db.commit()
     
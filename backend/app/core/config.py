@@ -18,9 +18,59 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "sqlite:///./data/app.db"
     
+    # Uploads
+    MAX_UPLOAD_SIZE_BYTES: int = 100 * 1024 * 1024
+    
     # Vector DB
     CHROMA_PERSIST_DIRECTORY: str = "./data/chroma_db"
     
+    # Tabular data (Excel sheets stored as SQLite tables)
+    TABULAR_DB_PATH: str = "./data/tables.db"
+    EXCEL_EMBED_MAX_ROWS: int = 200  # Rows per sheet embedded as text; the rest is queried from the tabular store
+    TABULAR_PROFILE_MAX_COLUMNS: int = 30  # Columns per sheet included in the prompt profile
+    
+    # Retrieval
+    RETRIEVAL_MODE: str = "single"  # "single" or "multi_query" (used for follow-up questions)
+    RETRIEVAL_K: int = 4
+    RETRIEVAL_TIMEOUT_SECONDS: float = 4.0  # Multi-query budget before falling back to single-query search
+    MULTI_QUERY_HYDE: bool = False  # Add a hypothetical answer (HyDE) as an extra sub-query
+    AUXILIARY_LLM_MODEL: str = "gpt-4o-mini"  # Cheap model for query rewriting/HyDE
+    
+    # Map-Reduce answering (cross-file questions)
+    # Defaults keep one map-reduce answer (4 x 3000 context tokens + completions)
+    # well inside CHAT_TPM_LIMIT; raise them together.
+    MAP_REDUCE_DISCOVERY_K: int = 50  # Chunks searched to pick candidate files
+    MAP_REDUCE_K_PER_GROUP: int = 6  # Chunks retrieved within each file
+    MAP_REDUCE_MAX_GROUPS: int = 4
+    MAP_REDUCE_CONCURRENCY: int = 4  # Concurrent map calls
+    MAP_REDUCE_TOKEN_BUDGET: int = 3000  # Context tokens per map call
+    
+    # Canvas conversation ingest
+    CONVERSATION_CHUNK_CHARS: int = 4000  # Long node messages are split into chunks of this size
+    CONVERSATION_SUMMARY_CONCURRENCY: int = 4  # Concurrent branch summary updates
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 8000  # Messages folded into a branch summary per LLM call
+    
+    # Provider rate limits (shared scheduler)
+    CHAT_RPM_LIMIT: int = 500
+    CHAT_TPM_LIMIT: int = 30000
+    EMBEDDING_RPM_LIMIT: int = 3000
+    EMBEDDING_TPM_LIMIT: int = 1000000
+    AUXILIARY_RPM_LIMIT: int = 500  # AUXILIARY_LLM_MODEL (query rewrite, HyDE, Canvas summaries)
+    AUXILIARY_TPM_LIMIT: int = 200000
+    CHAT_TOKENS_PER_REQUEST: int = 4000  # Estimated context + completion tokens per chat call
+    MAP_REDUCE_COMPLETION_TOKENS: int = 500  # Estimated completion tokens per map call
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 10.0  # Longer waits are rejected with 429 + Retry-After
+    BULK_RATE_LIMIT_MAX_WAIT_SECONDS: float = 120.0  # Per embedding batch of an upload or ingest
+    
+    # Multi-worker deployment (uvicorn --workers N)
+    MULTI_WORKER: bool = False  # Serialize index writes across processes and reload on version bumps
+    WORKER_COUNT: int = 1  # Rate-limit budgets are split evenly between workers
+    INDEX_SYNC_DIRECTORY: str = "./data/index_sync"
+    
+    # Startup
+    WARMUP_ON_STARTUP: bool = False  # Initialize the vector store in the background at startup
+    STARTUP_PROFILE: bool = False  # Record per-module import times during warm-up
+    
     # OpenAI - Load from environment
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     
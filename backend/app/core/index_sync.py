@@ -0,0 +1,49 @@
+import os
+from contextlib import contextmanager
+from app.core.config import settings
+
+# Coordination files shared by all worker processes on this host.
+#   index.lock     - held exclusively while a worker writes to the index
+#   index.version  - counter bumped after every write; readers reload on change
+
+
+def _path(name: str) -> str:
+    os.makedirs(settings.INDEX_SYNC_DIRECTORY, exist_ok=True)
+    return os.path.join(settings.INDEX_SYNC_DIRECTORY, name)
+
+
+@contextmanager
+def exclusive_lock(name: str = "index.lock"):
+    """Inter-process exclusive lock (blocks until no other worker holds it)."""
+    import fcntl  # POSIX only; multi-worker mode is not supported on Windows
+
+    with open(_path(name), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def current_version() -> int:
+    """Current index version (0 if nothing has been written yet)."""
+    try:
+        with open(_path("index.version")) as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_version() -> int:
+    """Increment the index version and return the new value.
+
+    Must be called while holding exclusive_lock(). The file is replaced
+    atomically so readers never see a partial write.
+    """
+    version = current_version() + 1
+    path = _path("index.version")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(version))
+    os.replace(tmp_path, path)
+    return version
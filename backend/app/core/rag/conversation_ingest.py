@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.rate_limiter import estimate_tokens
+from app.db import models
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# 분기 요약 갱신 프롬프트 (기존 요약 + 새 메시지만 전달)
+BRANCH_SUMMARY_PROMPT = """다음은 대화 분기의 기존 요약과 그 이후에 이어진 메시지입니다.
+기존 요약에 새 메시지의 핵심 내용(질문, 결론, 결정 사항, 수치)을 반영하여 갱신된 요약을 작성하세요.
+요약은 10문장 이내로 작성하세요.
+
+# 기존 요약:
+{previous_summary}
+
+# 이어진 메시지:
+{messages}
+
+# 갱신된 요약:"""
+
+ROLE_LABELS = {"user": "사용자", "assistant": "AI", "system": "시스템"}
+
+
+def node_hash(parent_id: Optional[str], role: str, content: str) -> str:
+    """Content hash of a node; moving a node to another parent also changes it."""
+    return hashlib.sha256(f"{parent_id or ''}\x00{role}\x00{content}".encode("utf-8")).hexdigest()
+
+
+class ConversationIngestor:
+    """Incrementally syncs a Canvas conversation tree into the vector store.
+
+    Only nodes that are new or whose content/parent changed since the last
+    export are re-embedded, and per-branch summaries (kept at leaves and
+    branch points) are extended from the deepest still-valid ancestor
+    summary instead of being regenerated.
+    """
+
+    def __init__(self, db: Session, document: models.Document, canvas_id: str, canvas_name: str):
+        self.db = db
+        self.document = document
+        self.canvas_id = canvas_id
+        self.canvas_name = canvas_name
+        self.nodes: Dict[str, models.CanvasNode] = {
+            node.node_id: node
+            for node in db.query(models.CanvasNode).filter(models.CanvasNode.canvas_id == canvas_id)
+        }
+        self.summaries: Dict[str, models.CanvasBranchSummary] = {
+            summary.node_id: summary
+            for summary in db.query(models.CanvasBranchSummary).filter(
+                models.CanvasBranchSummary.canvas_id == canvas_id
+            )
+        }
+        self.changed: List[str] = []
+        self.deleted: List[str] = []
+        self.updated_summaries: List[str] = []
+        self._replaced_vectors: Set[str] = set()
+        self._path_hashes: Dict[str, str] = {}
+
+    def _children(self) -> Dict[Optional[str], List[str]]:
+        children: Dict[Optional[str], List[str]] = {}
+        for node in self.nodes.values():
+            children.setdefault(node.parent_id, []).append(node.node_id)
+        return children
+
+    def apply_changes(self, nodes: List[Dict], deleted_node_ids: List[str]) -> int:
+        """Upsert changed nodes and remove deleted subtrees. Returns the unchanged count."""
+        # Deleting a node removes its whole subtree
+        children = self._children()
+        pending = [node_id for node_id in deleted_node_ids if node_id in self.nodes]
+        while pending:
+            node_id = pending.pop()
+            if node_id in self.deleted:
+                continue
+            self.deleted.append(node_id)
+            pending.extend(children.get(node_id, []))
+        for node_id in self.deleted:
+            self.db.delete(self.nodes.pop(node_id))
+            if node_id in self.summaries:
+                self.db.delete(self.summaries.pop(node_id))
+
+        unchanged = 0
+        for payload in nodes:
+            content_hash = node_hash(payload["parent_id"], payload["role"], payload["content"])
+            node = self.nodes.get(payload["id"])
+            if node is not None and node.content_hash == content_hash:
+                unchanged += 1
+                continue
+            if node is None:
+                node = models.CanvasNode(
+                    document_id=self.document.id,
+                    canvas_id=self.canvas_id,
+                    node_id=payload["id"]
+                )
+                self.db.add(node)
+                self.nodes[payload["id"]] = node
+            node.parent_id = payload["parent_id"]
+            node.role = payload["role"]
+            node.content = payload["content"]
+            node.content_hash = content_hash
+            self.changed.append(payload["id"])
+        return unchanged
+
+    def _path(self, node_id: str) -> List[models.CanvasNode]:
+        """Nodes from the root down to node_id (stops at missing parents)."""
+        path = []
+        seen: Set[str] = set()
+        while node_id in self.nodes and node_id not in seen:
+            seen.add(node_id)
+            node = self.nodes[node_id]
+            path.append(node)
+            node_id = node.parent_id
+        return list(reversed(path))
+
+    def _path_hash(self, node_id: str) -> str:
+        if node_id not in self._path_hashes:
+            digest = hashlib.sha256()
+            for node in self._path(node_id):
+                digest.update(node.content_hash.encode("ascii"))
+            self._path_hashes[node_id] = digest.hexdigest()
+        return self._path_hashes[node_id]
+
+    def _leaves(self) -> List[str]:
+        children = self._children()
+        return [node_id for node_id in self.nodes if not children.get(node_id)]
+
+    def _summary_targets(self) -> List[str]:
+        """Nodes that keep a summary: leaves, plus branch points so that new
+        branches extend the shared prefix instead of summarizing from the root."""
+        children = self._children()
+        return [node_id for node_id in self.nodes if len(children.get(node_id, [])) != 1]
+
+    def _has_valid_summary(self, node_id: str) -> bool:
+        summary = self.summaries.get(node_id)
+        return summary is not None and summary.path_hash == self._path_hash(node_id)
+
+    def stale_summaries(self) -> List[str]:
+        """Summary targets whose summary is missing or no longer matches their path."""
+        return [node_id for node_id in self._summary_targets() if not self._has_valid_summary(node_id)]
+
+    async def update_summaries(self, llm, acquire: Optional[Callable[[str], Awaitable[None]]] = None) -> None:
+        """Refresh every stale summary, branch points before the branches below them.
+
+        acquire(prompt) is awaited before each LLM call (rate limiting). A
+        summary that fails stays stale and is retried on the next ingest of
+        this canvas, since staleness is derived from the stored path hashes.
+        """
+        stale = set(self.stale_summaries())
+        # Wave = number of stale targets above a node; each wave builds on the previous one
+        waves: Dict[int, List[str]] = {}
+        for node_id in stale:
+            depth = sum(1 for node in self._path(node_id)[:-1] if node.node_id in stale)
+            waves.setdefault(depth, []).append(node_id)
+
+        semaphore = asyncio.Semaphore(settings.CONVERSATION_SUMMARY_CONCURRENCY)
+        for depth in sorted(waves):
+            wave = waves[depth]
+            results = await asyncio.gather(
+                *[self._summarize_branch(llm, semaphore, node_id, acquire) for node_id in wave],
+                return_exceptions=True
+            )
+            for node_id, result in zip(wave, results):
+                if isinstance(result, Exception):
+                    print(f"Warning: Could not summarize branch {node_id}: {result!r}")
+                    continue
+                self._store_summary(node_id, result)
+
+    def _store_summary(self, node_id: str, text: str):
+        summary = self.summaries.get(node_id)
+        if summary is None:
+            summary = models.CanvasBranchSummary(
+                document_id=self.document.id,
+                canvas_id=self.canvas_id,
+                node_id=node_id,
+                is_indexed=False
+            )
+            self.db.add(summary)
+            self.summaries[node_id] = summary
+        elif summary.is_indexed:
+            # The stored vector holds the previous text
+            self._replaced_vectors.add(node_id)
+            summary.is_indexed = False
+        summary.summary = text
+        summary.path_hash = self._path_hash(node_id)
+        self.updated_summaries.append(node_id)
+
+    async def _summarize_branch(
+        self,
+        llm,
+        semaphore: asyncio.Semaphore,
+        node_id: str,
+        acquire: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        """Summary of the path to node_id, extended from the deepest valid ancestor summary.
+
+        Messages are folded in segments of at most CONVERSATION_SUMMARY_MAX_TOKENS.
+        The summary after each intermediate segment is stored at the interior
+        node where the segment ends, so a long first ingest never needs one
+        oversized prompt and a failed fold resumes from there next time.
+        """
+        path = self._path(node_id)
+        # Start from the deepest ancestor whose summary still matches its path
+        start = 0
+        previous_summary = "(없음)"
+        for index in range(len(path) - 2, -1, -1):
+            if self._has_valid_summary(path[index].node_id):
+                start = index + 1
+                previous_summary = self.summaries[path[index].node_id].summary
+                break
+
+        max_tokens = settings.CONVERSATION_SUMMARY_MAX_TOKENS
+        segment: List[str] = []
+        segment_tokens = 0
+        for index in range(start, len(path)):
+            node = path[index]
+            # A single message longer than a whole segment is cut
+            content = node.content[:max_tokens * 4]
+            message = f"[{ROLE_LABELS.get(node.role, node.role)}] {content}"
+            tokens = estimate_tokens(message)
+            if segment and segment_tokens + tokens > max_tokens:
+                previous_summary = await self._fold(llm, semaphore, previous_summary, segment, acquire)
+                self._store_summary(path[index - 1].node_id, previous_summary)
+                segment, segment_tokens = [], 0
+            segment.append(message)
+            segment_tokens += tokens
+        return await self._fold(llm, semaphore, previous_summary, segment, acquire)
+
+    async def _fold(
+        self,
+        llm,
+        semaphore: asyncio.Semaphore,
+        previous_summary: str,
+        messages: List[str],
+        acquire: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> str:
+        prompt = BRANCH_SUMMARY_PROMPT.format(previous_summary=previous_summary, messages="\n\n".join(messages))
+        async with semaphore:
+            if acquire is not None:
+                await acquire(prompt)
+            result = await llm.ainvoke(prompt)
+        return result.content.strip()
+
+    def _indexed_summaries(self) -> Set[str]:
+        """Summaries that should have a vector: for each leaf, the deepest valid
+        summary on its path. A leaf whose summary could not be refreshed keeps
+        its ancestor's summary searchable until it succeeds."""
+        wanted = set()
+        for leaf in self._leaves():
+            for node in reversed(self._path(leaf)):
+                if self._has_valid_summary(node.node_id):
+                    wanted.add(node.node_id)
+                    break
+        return wanted
+
+    def _summary_changes(self) -> Tuple[Set[str], Set[str]]:
+        """(node ids whose summary vector must be removed, node ids to index)."""
+        wanted = self._indexed_summaries()
+        indexed = {node_id for node_id, summary in self.summaries.items() if summary.is_indexed}
+        remove = (indexed - wanted) | self._replaced_vectors | set(self.deleted)
+        add = {node_id for node_id in wanted if not self.summaries[node_id].is_indexed}
+        return remove, add
+
+    def stale_vector_filters(self) -> List[dict]:
+        """Chroma filters for vectors replaced or removed by this ingest."""
+        content_ids = set(self.changed) | set(self.deleted)
+        summary_ids, _ = self._summary_changes()
+        filters = []
+        for source_type, node_ids in (("canvas_node", content_ids), ("canvas_summary", summary_ids)):
+            if node_ids:
+                filters.append({"$and": [
+                    {"canvas_id": self.canvas_id},
+                    {"source_type": source_type},
+                    {"node_id": {"$in": sorted(node_ids)}},
+                ]})
+        return filters
+
+    def _chunks(self, content: str) -> List[str]:
+        chunk_chars = settings.CONVERSATION_CHUNK_CHARS
+        return [content[start:start + chunk_chars] for start in range(0, max(len(content), 1), chunk_chars)]
+
+    def build_documents(self) -> List["Document"]:
+        """Chunks for changed nodes plus the summaries that need a (new) vector."""
+        from langchain_core.documents import Document
+
+        base_metadata = {
+            "source": f"canvas://{self.canvas_id}",
+            "file_path": f"canvas://{self.canvas_id}",
+            "filename": self.canvas_name,
+            "document_id": self.document.id,
+            "canvas_id": self.canvas_id,
+        }
+        documents = []
+        for node_id in self.changed:
+            node = self.nodes[node_id]
+            for chunk_id, chunk in enumerate(self._chunks(node.content)):
+                documents.append(Document(
+                    page_content=chunk,
+                    metadata={
+                        **base_metadata,
+                        "node_id": node_id,
+                        "role": node.role,
+                        "source_type": "canvas_node",
+                        "chunk_id": chunk_id + 1,
+                    }
+                ))
+        _, add = self._summary_changes()
+        for node_id in sorted(add):
+            documents.append(Document(
+                page_content=self.summaries[node_id].summary,
+                metadata={**base_metadata, "node_id": node_id, "source_type": "canvas_summary"}
+            ))
+        return documents
+
+    def mark_indexed(self):
+        """Record which summaries have a vector; call after the vector write succeeded."""
+        wanted = self._indexed_summaries()
+        for node_id, summary in self.summaries.items():
+            summary.is_indexed = node_id in wanted
+        self._replaced_vectors.clear()
+
+    def vector_count(self) -> int:
+        """Vectors this canvas has in the store (node chunks plus summaries)."""
+        chunks = sum(len(self._chunks(node.content)) for node in self.nodes.values())
+        return chunks + len(self._indexed_summaries())
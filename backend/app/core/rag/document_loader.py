@@ -1,8 +1,12 @@
 import os
-from typing import List
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
-from langchain_core.documents import Document
-import pandas as pd
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from langchain_core.documents import Document
+
+TABULAR_EXTENSIONS = ('.xlsx', '.xls')
 
 class ExcelLoader:
     """Custom Excel loader that converts spreadsheets to text documents using pandas."""
@@ -10,58 +14,80 @@ class ExcelLoader:
     def __init__(self, file_path: str):
         self.file_path = file_path
     
-    def load(self) -> List[Document]:
-        """Load Excel file and convert to documents."""
-        documents = []
-        
+    def load_frames(self) -> Dict[str, "pd.DataFrame"]:
+        """Load every non-empty sheet as a DataFrame."""
+        import pandas as pd
+
+        frames = {}
         try:
             # Load all sheets
             xls = pd.ExcelFile(self.file_path)
             
             for sheet_name in xls.sheet_names:
-                df = pd.read_excel(self.file_path, sheet_name=sheet_name)
+                df = pd.read_excel(xls, sheet_name=sheet_name)
                 
                 # Drop all-NaN rows/cols
                 df = df.dropna(how='all').dropna(axis=1, how='all')
-                
-                # Convert to markdown table format or simple text
                 if not df.empty:
-                    # Convert dataframe to string representation
-                    content = f"### 시트: {sheet_name}\n\n"
-                    
-                    # Method 1: Convert to CSV-like string for better token efficiency
-                    # content += df.to_csv(index=False)
-                    
-                    # Method 2: Iterate rows for cleaner text
-                    rows = []
-                    # Get columns
-                    rows.append(" | ".join(map(str, df.columns)))
-                    rows.append("|".join(["---"] * len(df.columns)))
-                    
-                    for _, row in df.iterrows():
-                        row_values = []
-                        for val in row:
-                            if pd.isna(val):
-                                row_values.append("")
-                            else:
-                                row_values.append(str(val))
-                        rows.append(" | ".join(row_values))
-                    
-                    content += "\n".join(rows)
-                    
-                    documents.append(Document(
-                        page_content=content,
-                        metadata={
-                            "source": self.file_path,
-                            "sheet": sheet_name,
-                            "file_path": self.file_path,
-                            "file_type": "excel"
-                        }
-                    ))
+                    frames[sheet_name] = df
             
         except Exception as e:
             raise ValueError(f"Failed to load Excel file: {str(e)}")
         
+        return frames
+    
+    def load(self, frames: Optional[Dict[str, "pd.DataFrame"]] = None) -> List["Document"]:
+        """Load Excel file and convert to documents.
+        
+        Sheets longer than EXCEL_EMBED_MAX_ROWS are only embedded as a preview;
+        exact values are served from the tabular store.
+        """
+        import pandas as pd
+        from langchain_core.documents import Document
+
+        if frames is None:
+            frames = self.load_frames()
+        
+        documents = []
+        max_rows = settings.EXCEL_EMBED_MAX_ROWS
+        
+        for sheet_name, df in frames.items():
+            # Convert dataframe to string representation
+            content = f"### 시트: {sheet_name}\n\n"
+            
+            # Method 1: Convert to CSV-like string for better token efficiency
+            # content += df.to_csv(index=False)
+            
+            # Method 2: Iterate rows for cleaner text
+            rows = []
+            # Get columns
+            rows.append(" | ".join(map(str, df.columns)))
+            rows.append("|".join(["---"] * len(df.columns)))
+            
+            for _, row in df.head(max_rows).iterrows():
+                row_values = []
+                for val in row:
+                    if pd.isna(val):
+                        row_values.append("")
+                    else:
+                        row_values.append(str(val))
+                rows.append(" | ".join(row_values))
+            
+            content += "\n".join(rows)
+            if len(df) > max_rows:
+                content += f"\n\n(전체 {len(df)}행 중 {max_rows}행 미리보기. 집계 값은 정형 데이터 저장소에서 계산됩니다.)"
+            
+            documents.append(Document(
+                page_content=content,
+                metadata={
+                    "source": self.file_path,
+                    "sheet": sheet_name,
+                    "file_path": self.file_path,
+                    "file_type": "excel",
+                    "row_count": len(df)
+                }
+            ))
+        
         return documents
 
 
@@ -69,23 +95,36 @@ class UniversalDocumentLoader:
     """Document Loader that delegates to specific loaders based on file extension."""
     
     @classmethod
-    def load(cls, file_path: str) -> List[Document]:
+    def load(cls, file_path: str) -> List["Document"]:
+        documents, _ = cls.load_with_tables(file_path)
+        return documents
+    
+    @classmethod
+    def load_with_tables(cls, file_path: str) -> Tuple[List["Document"], Dict[str, "pd.DataFrame"]]:
+        """Load documents and, for spreadsheets, the parsed sheets (read only once)."""
         ext = os.path.splitext(file_path)[1].lower()
+        frames = {}
         
+        # Per-format loaders are imported on first use so that pypdf, docx2txt
+        # and pandas are only loaded when a file of that type is processed.
         if ext == '.pdf':
+            from langchain_community.document_loaders import PyPDFLoader
             loader = PyPDFLoader(file_path)
         elif ext == '.docx':
+            from langchain_community.document_loaders import Docx2txtLoader
             loader = Docx2txtLoader(file_path)
         elif ext in ['.txt', '.md']:
             # Use UTF-8 encoding for text files to support Korean
+            from langchain_community.document_loaders import TextLoader
             loader = TextLoader(file_path, encoding='utf-8')
-        elif ext in ['.xlsx', '.xls']:
+        elif ext in TABULAR_EXTENSIONS:
             # Excel files (using pandas)
             loader = ExcelLoader(file_path)
+            frames = loader.load_frames()
         else:
             raise ValueError(f"Unsupported file extension: {ext}")
         
-        documents = loader.load()
+        documents = loader.load(frames) if ext in TABULAR_EXTENSIONS else loader.load()
         
         # Ensure all content is properly encoded
         for doc in documents:
@@ -93,4 +132,4 @@ class UniversalDocumentLoader:
                 # Clean up any encoding issues
                 doc.page_content = doc.page_content.encode('utf-8', errors='ignore').decode('utf-8')
         
-        return documents
+        return documents, frames
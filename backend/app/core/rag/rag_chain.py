@@ -6,7 +6,9 @@ from langchain_core.output_parsers import StrOutputParser
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.documents import Document
 from app.core.config import settings
+import asyncio
 import os
+from functools import lru_cache
 
 # Few-Shot 예시
 FEW_SHOT_EXAMPLES = """
@@ -61,15 +63,84 @@ COT_SYSTEM_PROMPT = """당신은 제공된 문서를 기반으로 질문에 답
 """
 
 
+# 후속 질문 재작성 프롬프트 (Multi-Query 검색용)
+QUERY_REWRITE_PROMPT = """다음 대화 내용을 참고하여 마지막 질문을 대화 맥락 없이도 이해할 수 있는 독립적인 검색 질의로 다시 작성하세요.
+검색 질의 한 문장만 출력하세요.
+
+# 이전 대화:
+{history}
+
+# 마지막 질문:
+{question}
+
+# 검색 질의:"""
+
+# HyDE(가상 답변) 프롬프트
+HYDE_PROMPT = """다음 질문에 답하는 문서의 한 단락을 작성하세요. 사실 여부보다 문서에 등장할 법한 표현과 용어를 사용하는 것이 중요합니다.
+
+# 질문:
+{question}
+
+# 문서 단락:"""
+
+# Reciprocal Rank Fusion 상수
+RRF_K = 60
+
+# Map-Reduce 답변 프롬프트 (파일 그룹별 부분 답변)
+MAP_PROMPT = """다음은 파일 '{group}'에서 검색된 내용입니다. 이 파일의 내용만으로 질문에 답하는 데 필요한 사실, 수치, 문항/변수 정보를 정리하세요.
+관련 내용이 없으면 "관련 정보 없음"이라고만 답하세요. 정리한 내용에는 파일명을 출처로 표기하세요.
+
+# 파일 내용:
+{context}
+
+# 질문:
+{question}
+
+# 부분 답변:"""
+
+REDUCE_PROMPT = """# 파일별 부분 답변:
+{partial_answers}
+
+# 사용자 질문:
+{question}
+
+# 위 부분 답변들을 서로 교차 검증하여 하나의 답변으로 종합하고, 어느 파일에서 정보를 가져왔는지 명시해주세요:"""
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception:
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    """gpt-4o 토크나이저 기준 토큰 수 (tiktoken이 없으면 근사치)"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text))
+
+
 class RAGChain:
-    def __init__(self, retriever):
+    def __init__(self, retriever, vector_store_manager=None):
         self.retriever = retriever
+        # Multi-Query 검색에 필요 (배치 임베딩 + 벡터 검색)
+        self.vector_store_manager = vector_store_manager
         self.llm = ChatOpenAI(
             openai_api_key=settings.OPENAI_API_KEY,
             model="gpt-4o",
             temperature=0.1,
             streaming=True
         )
+        # 질의 재작성/HyDE 용 저비용 모델
+        self.aux_llm = ChatOpenAI(
+            openai_api_key=settings.OPENAI_API_KEY,
+            model=settings.AUXILIARY_LLM_MODEL,
+            temperature=0
+        )
         
         # 대화 히스토리를 포함한 프롬프트
         self.prompt = ChatPromptTemplate.from_messages([
@@ -85,6 +156,13 @@ class RAGChain:
 # 답변 시 반드시 어느 문서에서 정보를 가져왔는지 언급해주세요:""")
         ])
         
+        # Map-Reduce 종합 단계 프롬프트
+        self.reduce_prompt = ChatPromptTemplate.from_messages([
+            ("system", COT_SYSTEM_PROMPT),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("human", REDUCE_PROMPT)
+        ])
+        
         # 기존 호환성을 위한 단순 프롬프트
         self.simple_prompt = ChatPromptTemplate.from_template(
             """당신은 제공된 문서를 기반으로 질문에 답변하는 AI 어시스턴트입니다.
@@ -141,6 +219,46 @@ class RAGChain:
         
         return "\n\n---\n\n".join(formatted_parts), sources
 
+    async def _tabular_context(self, docs: List[Document], question: str) -> str:
+        """검색된 엑셀 시트의 정확한 집계 결과 (SQLite 조회는 스레드에서 실행)"""
+        keys = []
+        for doc in docs:
+            metadata = doc.metadata or {}
+            if metadata.get("file_type") != "excel" or metadata.get("document_id") is None:
+                continue
+            key = (metadata["document_id"], metadata.get("sheet"))
+            if key not in keys:
+                keys.append(key)
+        if not keys:
+            return ""
+        try:
+            return await asyncio.to_thread(self._build_tabular_context, keys, question)
+        except Exception as e:
+            print(f"Warning: Could not build tabular context: {e}")
+            return ""
+
+    def _build_tabular_context(self, keys: List[Tuple[int, Optional[str]]], question: str) -> str:
+        from app.core.rag.tabular_store import get_tabular_store
+        store = get_tabular_store()
+        parts = []
+        for document_id, sheet in keys:
+            for schema in store.list_tables(document_id):
+                if schema["sheet"] != sheet:
+                    continue
+                # 시트 프로파일(캐시됨) + 질문에 언급된 열에 대한 집계
+                parts.append(store.profile(schema["table_name"]))
+                aggregation = store.answer_question(schema["table_name"], question)
+                if aggregation:
+                    parts.append(aggregation)
+        if not parts:
+            return ""
+        return "📊 **정형 데이터 집계 결과 (전체 행 기준 정확한 값)**\n\n" + "\n\n".join(parts)
+
+    def _with_tabular_context(self, context: str, tabular_context: str) -> str:
+        if not tabular_context:
+            return context
+        return f"{context}\n\n---\n\n{tabular_context}"
+
     def _format_docs(self, docs):
         """단순 포맷 (호환성용)"""
         context, _ = self._format_docs_with_sources(docs)
@@ -156,6 +274,240 @@ class RAGChain:
                 messages.append(AIMessage(content=msg.get("content", "")))
         return messages
 
+    def _enhanced_query(self, question: str, history: List[Dict]) -> str:
+        """최근 대화 내용을 덧붙인 단일 검색 질의"""
+        if not history:
+            return question
+        recent_context = " ".join([
+            msg.get("content", "")[:100]
+            for msg in history[-3:]
+        ])
+        return f"{recent_context} {question}"
+
+    async def _generate_sub_queries(self, question: str, history: List[Dict]) -> List[str]:
+        """원 질문, 대화 맥락 기반 재작성 질의, (선택) HyDE 단락을 생성"""
+        tasks = []
+        if history:
+            history_text = "\n".join(
+                f"{msg.get('role', 'user')}: {msg.get('content', '')[:500]}"
+                for msg in history[-6:]
+            )
+            rewrite_prompt = QUERY_REWRITE_PROMPT.format(history=history_text, question=question)
+            tasks.append(self.aux_llm.ainvoke(rewrite_prompt))
+        if settings.MULTI_QUERY_HYDE:
+            tasks.append(self.aux_llm.ainvoke(HYDE_PROMPT.format(question=question)))
+
+        queries = [question]
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                continue
+            text = (result.content or "").strip()
+            if text and text not in queries:
+                queries.append(text)
+        return queries
+
+    def _fuse_results(self, result_lists: List[List[Document]], k: int) -> List[Document]:
+        """Reciprocal Rank Fusion으로 결과를 병합하고 중복 청크 제거"""
+        scores: Dict[Tuple, float] = {}
+        docs_by_key: Dict[Tuple, Document] = {}
+        for results in result_lists:
+            for rank, doc in enumerate(results):
+                metadata = doc.metadata or {}
+                key = (
+                    metadata.get("document_id", metadata.get("source")),
+                    doc.page_content,
+                )
+                scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+                docs_by_key.setdefault(key, doc)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return [docs_by_key[key] for key in ranked[:k]]
+
+    async def _multi_query_retrieve(self, question: str, history: List[Dict]) -> List[Document]:
+        """하위 질의를 한 번에 임베딩하고 병렬 검색 후 결과 병합"""
+        k = settings.RETRIEVAL_K
+        queries = await self._generate_sub_queries(question, history)
+        embeddings = await self.vector_store_manager.aembed_queries(queries)
+        result_lists = await asyncio.gather(*[
+            self.vector_store_manager.asearch_by_vector(embedding, k=k)
+            for embedding in embeddings
+        ])
+        return self._fuse_results(result_lists, k)
+
+    async def aretrieve(
+        self,
+        question: str,
+        chat_history: Optional[List[Dict]] = None,
+        retrieval_mode: Optional[str] = None
+    ) -> List[Document]:
+        """검색 모드에 따라 문서 검색
+
+        multi_query 모드는 RETRIEVAL_TIMEOUT_SECONDS 안에 끝나지 않거나 실패하면
+        기존 단일 질의 검색으로 대체합니다.
+        """
+        history = chat_history or []
+        mode = retrieval_mode or settings.RETRIEVAL_MODE
+        if mode == "multi_query" and self.vector_store_manager is not None:
+            try:
+                return await asyncio.wait_for(
+                    self._multi_query_retrieve(question, history),
+                    timeout=settings.RETRIEVAL_TIMEOUT_SECONDS
+                )
+            except Exception as e:
+                print(f"Warning: multi-query retrieval failed, falling back to single query: {e!r}")
+        return await self.retriever.ainvoke(self._enhanced_query(question, history))
+
+    def _group_docs(self, docs: List[Document]) -> Dict[str, List[Document]]:
+        """검색된 청크를 파일 단위로 묶기 (검색 순위 순서 유지)"""
+        groups: Dict[str, List[Document]] = {}
+        for doc in docs:
+            metadata = doc.metadata or {}
+            name = metadata.get("filename") or os.path.basename(
+                metadata.get("source", metadata.get("file_path", "Unknown"))
+            )
+            groups.setdefault(name, []).append(doc)
+        return groups
+
+    def _fit_token_budget(self, docs: List[Document], budget: int) -> List[Document]:
+        """토큰 예산 안에 들어가는 청크만 선택 (첫 청크는 잘라서라도 포함)"""
+        selected = []
+        used = 0
+        for doc in docs:
+            tokens = _count_tokens(doc.page_content)
+            if used + tokens > budget:
+                if not selected:
+                    # 대형 시트 등 단일 청크가 예산을 넘는 경우
+                    ratio = budget / max(tokens, 1)
+                    content = doc.page_content[:int(len(doc.page_content) * ratio)]
+                    selected.append(Document(page_content=content, metadata=doc.metadata))
+                break
+            selected.append(doc)
+            used += tokens
+        return selected
+
+    async def _map_group(
+        self,
+        semaphore: asyncio.Semaphore,
+        group: str,
+        docs: List[Document],
+        question: str
+    ) -> Tuple[str, str]:
+        """파일 그룹 하나에 대한 부분 답변 생성"""
+        context, _ = self._format_docs_with_sources(
+            self._fit_token_budget(docs, settings.MAP_REDUCE_TOKEN_BUDGET)
+        )
+        prompt = MAP_PROMPT.format(group=group, context=context, question=question)
+        async with semaphore:
+            result = await self.llm.ainvoke(prompt)
+        return group, result.content
+
+    async def _retrieve_groups(
+        self,
+        query: str,
+        document_ids: Optional[List[int]] = None
+    ) -> List[Tuple[str, List[Document]]]:
+        """파일(문서)별로 검색한 청크 그룹
+
+        document_ids가 없으면 넓은 범위 검색으로 후보 파일을 고른 뒤,
+        각 파일 안에서 다시 검색합니다 (질의 임베딩은 한 번만 계산).
+        """
+        max_groups = settings.MAP_REDUCE_MAX_GROUPS
+        if self.vector_store_manager is None:
+            docs = await self.retriever.ainvoke(query)
+            return list(self._group_docs(docs).items())[:max_groups]
+        
+        embedding = (await self.vector_store_manager.aembed_queries([query]))[0]
+        if not document_ids:
+            candidates = await self.vector_store_manager.asearch_by_vector(
+                embedding, k=settings.MAP_REDUCE_DISCOVERY_K
+            )
+            document_ids = []
+            for doc in candidates:
+                document_id = (doc.metadata or {}).get("document_id")
+                if document_id is not None and document_id not in document_ids:
+                    document_ids.append(document_id)
+        document_ids = document_ids[:max_groups]
+        
+        results = await asyncio.gather(*[
+            self.vector_store_manager.asearch_by_vector(
+                embedding,
+                k=settings.MAP_REDUCE_K_PER_GROUP,
+                filter={"document_id": document_id}
+            )
+            for document_id in document_ids
+        ])
+        groups = []
+        for docs in results:
+            if docs:
+                groups.extend(self._group_docs(docs).items())
+        return groups
+
+    async def astream_answer_map_reduce(
+        self,
+        question: str,
+        chat_history: Optional[List[Dict]] = None,
+        document_ids: Optional[List[int]] = None
+    ) -> AsyncGenerator[str, None]:
+        """파일 간 교차 검증 질문용 Map-Reduce 스트리밍
+
+        파일별로 검색한 그룹에 대해 부분 답변(map)을 동시에 생성한 뒤,
+        이를 종합하는 답변(reduce)을 스트리밍합니다.
+        """
+        history = chat_history or []
+        formatted_history = self._format_chat_history(history)
+        
+        query = self._enhanced_query(question, history)
+        groups = await self._retrieve_groups(query, document_ids)
+        # 출처는 실제로 map 단계에 전달된 그룹의 청크만 표시
+        kept_docs = [doc for _, group_docs in groups for doc in group_docs]
+        _, sources = self._format_docs_with_sources(kept_docs)
+        # 정형 데이터 집계는 그룹별이 아니라 한 번만 계산해 종합 단계에 전달
+        tabular_context = await self._tabular_context(kept_docs, question)
+        
+        semaphore = asyncio.Semaphore(settings.MAP_REDUCE_CONCURRENCY)
+        results = await asyncio.gather(
+            *[self._map_group(semaphore, group, group_docs, question) for group, group_docs in groups],
+            return_exceptions=True
+        )
+        
+        partial_answers = []
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Warning: map step failed: {result!r}")
+                continue
+            group, answer = result
+            partial_answers.append(f"### 📄 {group}\n{answer}")
+        if not partial_answers:
+            partial_answers.append("관련 문서를 찾을 수 없습니다.")
+        if tabular_context:
+            partial_answers.append(tabular_context)
+        
+        chain = self.reduce_prompt | self.llm | StrOutputParser()
+        
+        async for chunk in chain.astream({
+            "partial_answers": "\n\n---\n\n".join(partial_answers),
+            "question": question,
+            "chat_history": formatted_history,
+            "few_shot_examples": FEW_SHOT_EXAMPLES
+        }):
+            yield chunk
+        
+        for source_text in self._format_sources_footer(sources):
+            yield source_text
+
+    def _format_sources_footer(self, sources: List[Dict]) -> List[str]:
+        """답변 마지막에 붙일 출처 정보 (파일 경로 포함)"""
+        if not sources:
+            return []
+        parts = ["\n\n---\n📚 **출처:**\n"]
+        for src in sources:
+            source_text = f"- **{src['document']}**"
+            if src.get('page'):
+                source_text += f" (p.{src['page']})"
+            source_text += f"\n  📁 경로: `{src.get('file_path', 'N/A')}`"
+            source_text += f"\n  📝 발췌: \"{src['excerpt'][:100]}...\"\n"
+            parts.append(source_text)
+        return parts
+
     def get_chain(self):
         """기존 호환성을 위한 단순 체인"""
         rag_chain = (
@@ -168,37 +520,29 @@ class RAGChain:
 
     async def astream_answer(self, question: str) -> AsyncGenerator[str, None]:
         """기존 호환성을 위한 스트리밍"""
-        chain = (
-            {"context": self.retriever | self._format_docs, "question": RunnablePassthrough()}
-            | self.simple_prompt
-            | self.llm
-            | StrOutputParser()
+        docs = await self.retriever.ainvoke(question)
+        context = self._with_tabular_context(
+            self._format_docs(docs), await self._tabular_context(docs, question)
         )
+        chain = self.simple_prompt | self.llm | StrOutputParser()
         
-        async for chunk in chain.astream(question):
+        async for chunk in chain.astream({"context": context, "question": question}):
             yield chunk
 
     async def astream_answer_with_history(
         self, 
         question: str, 
-        chat_history: Optional[List[Dict]] = None
+        chat_history: Optional[List[Dict]] = None,
+        retrieval_mode: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
         """대화 히스토리와 CoT를 포함한 고급 스트리밍"""
         history = chat_history or []
         formatted_history = self._format_chat_history(history)
         
-        # 컨텍스트 검색 (최근 대화 내용도 쿼리에 포함)
-        enhanced_query = question
-        if history:
-            recent_context = " ".join([
-                msg.get("content", "")[:100] 
-                for msg in history[-3:]
-            ])
-            enhanced_query = f"{recent_context} {question}"
-        
-        # 문서 검색
-        docs = self.retriever.invoke(enhanced_query)
+        # 문서 검색 (single: 최근 대화 내용을 쿼리에 포함, multi_query: 하위 질의 병렬 검색)
+        docs = await self.aretrieve(question, history, retrieval_mode)
         context, sources = self._format_docs_with_sources(docs)
+        context = self._with_tabular_context(context, await self._tabular_context(docs, question))
         
         # 체인 실행
         chain = self.prompt | self.llm | StrOutputParser()
@@ -212,15 +556,8 @@ class RAGChain:
             yield chunk
         
         # 마지막에 출처 정보 추가 (파일 경로 포함)
-        if sources:
-            yield "\n\n---\n📚 **출처:**\n"
-            for i, src in enumerate(sources):
-                source_text = f"- **{src['document']}**"
-                if src.get('page'):
-                    source_text += f" (p.{src['page']})"
-                source_text += f"\n  📁 경로: `{src.get('file_path', 'N/A')}`"
-                source_text += f"\n  📝 발췌: \"{src['excerpt'][:100]}...\"\n"
-                yield source_text
+        for source_text in self._format_sources_footer(sources):
+            yield source_text
 
     async def get_sources(self, question: str) -> List[Dict]:
         """질문에 대한 소스 문서 정보만 반환"""
@@ -0,0 +1,353 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, TYPE_CHECKING
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+AGGREGATIONS = ("count", "sum", "avg", "min", "max")
+
+# Question keywords that select the aggregation for a grouped numeric column (default: avg)
+AGGREGATION_KEYWORDS = {
+    "sum": ("합계", "총합", "총액", "sum", "total"),
+    "max": ("최대", "최고", "가장 높", "max"),
+    "min": ("최소", "최저", "가장 낮", "min"),
+    "count": ("개수", "건수", "몇 명", "몇 개", "count"),
+}
+
+
+def _is_numeric(dtype: str) -> bool:
+    return dtype.startswith(("int", "float"))
+
+
+def _quote(identifier: str) -> str:
+    """Quote an SQLite identifier (table or column name)."""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _to_markdown(headers: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    """Render rows as a compact markdown table."""
+    lines = [" | ".join(map(str, headers)), "|".join(["---"] * len(headers))]
+    for row in rows:
+        lines.append(" | ".join("" if value is None else str(value) for value in row))
+    return "\n".join(lines)
+
+
+class TabularStore:
+    """Columnar copy of uploaded spreadsheets, one SQLite table per sheet.
+
+    Numeric and statistical questions are answered with exact SQL aggregations
+    on these tables instead of an LLM reading a truncated markdown dump.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.TABULAR_DB_PATH
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        # Keyed by the table's generation, which every worker sees in
+        # sheet_schemas, so a table name reused for another upload (SQLite
+        # reuses deleted document ids) never serves a stale profile.
+        self._profiles: Dict[tuple, str] = {}
+        self._profiles_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS sheet_schemas (
+                    table_name TEXT PRIMARY KEY,
+                    document_id INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    sheet TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    columns TEXT NOT NULL,
+                    generation TEXT NOT NULL DEFAULT ''
+                )"""
+            )
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(sheet_schemas)")}
+            if "generation" not in existing:
+                # Stores created before profiles were cached
+                conn.execute("ALTER TABLE sheet_schemas ADD COLUMN generation TEXT NOT NULL DEFAULT ''")
+
+    @contextmanager
+    def _connect(self):
+        # Wait for other workers' writes instead of failing with "database is locked"
+        conn = sqlite3.connect(self.db_path, timeout=5.0)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def store_workbook(self, document_id: int, filename: str, frames: Dict[str, "pd.DataFrame"]) -> List[Dict]:
+        """Persist every sheet of a workbook and return their schemas."""
+        schemas = []
+        with self._connect() as conn:
+            for index, (sheet, df) in enumerate(frames.items()):
+                table_name = f"doc{document_id}_sheet{index}"
+                self._invalidate_profiles(table_name)
+                df = df.copy()
+                df.columns = self._unique_columns(df.columns)
+                df.to_sql(table_name, conn, if_exists="replace", index=False)
+
+                columns = [{"name": name, "dtype": str(dtype)} for name, dtype in df.dtypes.items()]
+                conn.execute(
+                    "INSERT OR REPLACE INTO sheet_schemas "
+                    "(table_name, document_id, filename, sheet, row_count, columns, generation) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        table_name, document_id, filename, sheet, len(df),
+                        json.dumps(columns, ensure_ascii=False), uuid.uuid4().hex
+                    )
+                )
+                schemas.append({
+                    "table_name": table_name,
+                    "document_id": document_id,
+                    "filename": filename,
+                    "sheet": sheet,
+                    "row_count": len(df),
+                    "columns": columns,
+                })
+        return schemas
+
+    @staticmethod
+    def _unique_columns(columns) -> List[str]:
+        # SQLite column names are case-insensitive ("Q1" and "q1" collide)
+        names = []
+        seen = set()
+        for column in columns:
+            name = str(column).strip() or "column"
+            candidate, counter = name, 1
+            while candidate.casefold() in seen:
+                candidate = f"{name}_{counter}"
+                counter += 1
+            names.append(candidate)
+            seen.add(candidate.casefold())
+        return names
+
+    def _invalidate_profiles(self, table_name: str):
+        with self._profiles_lock:
+            for key in [key for key in self._profiles if key[0] == table_name]:
+                del self._profiles[key]
+
+    def list_tables(self, document_id: Optional[int] = None) -> List[Dict]:
+        """Return schema metadata for all tables, optionally for one document."""
+        query = "SELECT table_name, document_id, filename, sheet, row_count, columns FROM sheet_schemas"
+        params: tuple = ()
+        if document_id is not None:
+            query += " WHERE document_id = ?"
+            params = (document_id,)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY table_name", params).fetchall()
+        return [
+            {
+                "table_name": row[0],
+                "document_id": row[1],
+                "filename": row[2],
+                "sheet": row[3],
+                "row_count": row[4],
+                "columns": json.loads(row[5]),
+            }
+            for row in rows
+        ]
+
+    def get_schema(self, table_name: str) -> Dict:
+        for schema in self.list_tables():
+            if schema["table_name"] == table_name:
+                return schema
+        raise ValueError(f"Unknown table: {table_name}")
+
+    def _generation(self, table_name: str) -> str:
+        """Identifier of the current contents of a table (changes whenever it is stored)."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT generation FROM sheet_schemas WHERE table_name = ?", (table_name,)
+            ).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown table: {table_name}")
+        return row[0]
+
+    def _check_columns(self, schema: Dict, *columns: Optional[str]):
+        known = {column["name"] for column in schema["columns"]}
+        for column in columns:
+            if column is not None and column not in known:
+                raise ValueError(f"Unknown column '{column}' in {schema['table_name']}")
+
+    def delete_by_document_id(self, document_id: int) -> int:
+        """Drop all tables of a document. Returns the number of dropped tables."""
+        tables = self.list_tables(document_id)
+        with self._connect() as conn:
+            for schema in tables:
+                self._invalidate_profiles(schema["table_name"])
+                conn.execute(f"DROP TABLE IF EXISTS {_quote(schema['table_name'])}")
+            conn.execute("DELETE FROM sheet_schemas WHERE document_id = ?", (document_id,))
+        return len(tables)
+
+    # Aggregations
+
+    def missing_rates(self, table_name: str) -> List[Dict]:
+        """Missing-value count and rate (NULL or empty string) for every column."""
+        schema = self.get_schema(table_name)
+        names = [column["name"] for column in schema["columns"]]
+        if not names:
+            return []
+        select = ", ".join(
+            f"SUM(CASE WHEN {_quote(name)} IS NULL OR {_quote(name)} = '' THEN 1 ELSE 0 END)"
+            for name in names
+        )
+        with self._connect() as conn:
+            counts = conn.execute(f"SELECT {select} FROM {_quote(table_name)}").fetchone()
+        total = schema["row_count"]
+        return [
+            {
+                "column": name,
+                "missing": count or 0,
+                "missing_rate": round((count or 0) / total, 4) if total else 0.0,
+            }
+            for name, count in zip(names, counts)
+        ]
+
+    def value_counts(self, table_name: str, column: str, limit: int = 10) -> List[Dict]:
+        """Most frequent values of a column (NULL included)."""
+        if not column:
+            raise ValueError("value_counts requires a column")
+        schema = self.get_schema(table_name)
+        self._check_columns(schema, column)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {_quote(column)}, COUNT(*) AS n FROM {_quote(table_name)} "
+                f"GROUP BY {_quote(column)} ORDER BY n DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [{"value": value, "count": count} for value, count in rows]
+
+    def group_by(
+        self,
+        table_name: str,
+        by: str,
+        column: Optional[str] = None,
+        agg: str = "count",
+        limit: int = 50
+    ) -> List[Dict]:
+        """Aggregate a column (or count rows) grouped by another column."""
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {agg}")
+        if not by:
+            raise ValueError("group_by requires a 'by' column")
+        schema = self.get_schema(table_name)
+        self._check_columns(schema, by, column)
+        if agg == "count":
+            target = f"COUNT({_quote(column)})" if column else "COUNT(*)"
+        elif column is None:
+            raise ValueError(f"Aggregation '{agg}' requires a column")
+        else:
+            target = f"{agg.upper()}({_quote(column)})"
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {_quote(by)}, {target} FROM {_quote(table_name)} "
+                f"GROUP BY {_quote(by)} ORDER BY 2 DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [{by: key, agg: value} for key, value in rows]
+
+    def profile(self, table_name: str, max_columns: Optional[int] = None) -> str:
+        """Compact markdown profile of a sheet: per-column missing rate and numeric summary."""
+        max_columns = max_columns or settings.TABULAR_PROFILE_MAX_COLUMNS
+        key = (table_name, self._generation(table_name), max_columns)
+        with self._profiles_lock:
+            cached = self._profiles.get(key)
+        if cached is None:
+            cached = self._build_profile(table_name, max_columns)
+            # Drop profiles of earlier generations of this table
+            self._invalidate_profiles(table_name)
+            with self._profiles_lock:
+                self._profiles[key] = cached
+        return cached
+
+    def _build_profile(self, table_name: str, max_columns: int) -> str:
+        schema = self.get_schema(table_name)
+        missing = {row["column"]: row for row in self.missing_rates(table_name)}
+        numeric = [
+            column["name"] for column in schema["columns"][:max_columns]
+            if _is_numeric(column["dtype"])
+        ]
+        stats: Dict[str, tuple] = {}
+        if numeric:
+            select = ", ".join(
+                f"MIN({_quote(name)}), AVG({_quote(name)}), MAX({_quote(name)})" for name in numeric
+            )
+            with self._connect() as conn:
+                values = conn.execute(f"SELECT {select} FROM {_quote(table_name)}").fetchone()
+            for i, name in enumerate(numeric):
+                stats[name] = values[i * 3:i * 3 + 3]
+
+        rows = []
+        for column in schema["columns"][:max_columns]:
+            name = column["name"]
+            low, mean, high = stats.get(name, (None, None, None))
+            rows.append([
+                name,
+                column["dtype"],
+                missing[name]["missing"],
+                f"{missing[name]['missing_rate'] * 100:.1f}%",
+                low,
+                round(mean, 3) if mean is not None else None,
+                high,
+            ])
+        header = f"#### {schema['filename']} / 시트: {schema['sheet']} (총 {schema['row_count']}행, {len(schema['columns'])}열)"
+        table = _to_markdown(["열", "타입", "결측", "결측률", "최소", "평균", "최대"], rows)
+        if len(schema["columns"]) > max_columns:
+            table += f"\n(외 {len(schema['columns']) - max_columns}개 열 생략)"
+        return f"{header}\n{table}"
+
+    def answer_question(self, table_name: str, question: str, limit: int = 20) -> str:
+        """Run the aggregation a question asks for, picked by the column names it mentions.
+
+        A categorical and a numeric column together give the numeric column
+        aggregated per category; otherwise the first mentioned column gives its
+        value counts (also useful for numerically coded survey answers).
+        Returns "" when the question names no column of the table.
+        """
+        schema = self.get_schema(table_name)
+        text = question.casefold()
+        categorical, numeric = [], []
+        # Longest names first so "Q10" is not also read as "Q1"
+        for column in sorted(schema["columns"], key=lambda column: -len(column["name"])):
+            name = column["name"].casefold()
+            if len(name) < 2 or name not in text:
+                continue
+            text = text.replace(name, " ")
+            (numeric if _is_numeric(column["dtype"]) else categorical).append(column["name"])
+        if not categorical and not numeric:
+            return ""
+
+        if categorical and numeric:
+            by = categorical[0]
+            agg = next(
+                (agg for agg, words in AGGREGATION_KEYWORDS.items() if any(word in question.casefold() for word in words)),
+                "avg"
+            )
+            rows = self.group_by(table_name, by, numeric[0], agg, limit)
+            title = f"{by}별 {numeric[0]} {agg}"
+            table = _to_markdown([by, agg], [[row[by], row[agg]] for row in rows])
+        else:
+            by = (categorical or numeric)[0]
+            rows = self.value_counts(table_name, by, limit)
+            title = f"{by} 값 분포"
+            table = _to_markdown([by, "빈도"], [[row["value"], row["count"]] for row in rows])
+        return f"#### {schema['filename']} / 시트: {schema['sheet']} — {title}\n{table}"
+
+
+_tabular_store: Optional[TabularStore] = None
+_tabular_store_lock = threading.Lock()
+
+
+def get_tabular_store() -> TabularStore:
+    """Return the shared TabularStore, creating it on first use."""
+    global _tabular_store
+    if _tabular_store is None:
+        with _tabular_store_lock:
+            if _tabular_store is None:
+                _tabular_store = TabularStore()
+    return _tabular_store
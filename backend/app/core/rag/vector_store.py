@@ -1,13 +1,25 @@
-from typing import List, Optional
-import chromadb
-from chromadb.config import Settings as ChromaSettings
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.documents import Document
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import List, Optional, TYPE_CHECKING
+from app.core import index_sync
 from app.core.config import settings
 
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
 class VectorStoreManager:
+    # Index version this instance was loaded at (multi-worker mode only)
+    index_version: Optional[int] = None
+
     def __init__(self):
+        # Heavy dependencies are imported here so that importing this module
+        # (e.g. from the API routers) does not pull in chromadb/langchain.
+        import chromadb
+        from langchain_chroma import Chroma
+        from langchain_openai import OpenAIEmbeddings
+
         self.embeddings = OpenAIEmbeddings(
             openai_api_key=settings.OPENAI_API_KEY,
             model="text-embedding-3-small"
@@ -25,21 +37,35 @@ class VectorStoreManager:
             persist_directory=self.persist_directory
         )
 
-    def add_documents(self, documents: List[Document]):
-        """Add documents to the vector store."""
+    def add_documents(self, documents: List["Document"]):
+        """Add documents to the vector store (one batched embeddings call)."""
         if not documents:
             return
         
         # Use simpler add_documents from LangChain wrapper
         self.vector_store.add_documents(documents)
 
-    def search(self, query: str, k: int = 4) -> List[Document]:
+    def search(self, query: str, k: int = 4) -> List["Document"]:
         """Search for similar documents."""
         return self.vector_store.similarity_search(query, k=k)
 
+    async def asearch(self, query: str, k: int = 4) -> List["Document"]:
+        """Search for similar documents without blocking the event loop."""
+        return await self.vector_store.asimilarity_search(query, k=k)
+
+    async def aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries with a single batched embeddings call."""
+        return await self.embeddings.aembed_documents(queries)
+
+    async def asearch_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List["Document"]:
+        """Search for similar documents using a precomputed query embedding."""
+        return await self.vector_store.asimilarity_search_by_vector(embedding, k=k, filter=filter)
+
     def get_retriever(self, search_kwargs: dict = None):
         if search_kwargs is None:
-            search_kwargs = {"k": 4}
+            search_kwargs = {"k": settings.RETRIEVAL_K}
         return self.vector_store.as_retriever(search_kwargs=search_kwargs)
 
     def delete_by_document_id(self, document_id: int) -> int:
@@ -63,6 +89,24 @@ class VectorStoreManager:
             print(f"Error deleting vectors for document {document_id}: {e}")
             return 0
 
+    def delete_where(self, where: dict) -> int:
+        """Delete all vectors matching a Chroma metadata filter.
+        
+        Returns the number of deleted vectors.
+        """
+        try:
+            results = self._collection.get(where=where)
+            
+            if results and results.get("ids"):
+                ids_to_delete = results["ids"]
+                self._collection.delete(ids=ids_to_delete)
+                return len(ids_to_delete)
+            
+            return 0
+        except Exception as e:
+            print(f"Error deleting vectors for filter {where}: {e}")
+            return 0
+
     def delete_by_filename(self, filename: str) -> int:
         """Delete all vectors associated with a filename.
         
@@ -83,3 +127,71 @@ class VectorStoreManager:
         except Exception as e:
             print(f"Error deleting vectors for filename {filename}: {e}")
             return 0
+
+
+
+_vector_store_manager: Optional[VectorStoreManager] = None
+_vector_store_lock = threading.Lock()
+
+
+def _is_stale(manager: Optional[VectorStoreManager]) -> bool:
+    if manager is None:
+        return True
+    # Another worker wrote to the index since this replica was loaded
+    return settings.MULTI_WORKER and manager.index_version != index_sync.current_version()
+
+
+def get_vector_store_manager() -> VectorStoreManager:
+    """Return the shared VectorStoreManager, creating it on first use.
+
+    In multi-worker mode the instance is a read replica that is reloaded
+    whenever the on-disk index version changes. Reloading opens the index
+    from disk, so async code should use aget_vector_store_manager().
+    """
+    global _vector_store_manager
+    if _is_stale(_vector_store_manager):
+        with _vector_store_lock:
+            if _is_stale(_vector_store_manager):
+                version = index_sync.current_version() if settings.MULTI_WORKER else None
+                old = _vector_store_manager
+                if old is not None:
+                    # chromadb caches one system per path; drop it to reopen from disk.
+                    from chromadb.api.client import SharedSystemClient
+                    old_system = old._client._system
+                    SharedSystemClient.clear_system_cache()
+                    # Requests still holding the old store keep using it; its system
+                    # (connections, caches) is stopped once the last of them is done.
+                    weakref.finalize(old.vector_store, old_system.stop)
+                manager = VectorStoreManager()
+                manager.index_version = version
+                _vector_store_manager = manager
+    return _vector_store_manager
+
+
+async def aget_vector_store_manager() -> VectorStoreManager:
+    """get_vector_store_manager() for request handlers: reloads run in a worker thread."""
+    manager = _vector_store_manager
+    if manager is not None and not settings.MULTI_WORKER:
+        return manager
+    # Checking the index version reads a file, and a reload opens the index
+    return await asyncio.to_thread(get_vector_store_manager)
+
+
+@contextmanager
+def index_writer():
+    """Yield the VectorStoreManager for writing.
+
+    In multi-worker mode only one process writes at a time, and the index
+    version is bumped afterwards so other workers reload their replicas.
+    Blocks while another worker is writing, so call it off the event loop.
+    """
+    if not settings.MULTI_WORKER:
+        yield get_vector_store_manager()
+        return
+    
+    with index_sync.exclusive_lock():
+        manager = get_vector_store_manager()
+        try:
+            yield manager
+        finally:
+            manager.index_version = index_sync.bump_version()
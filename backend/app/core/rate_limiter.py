@@ -0,0 +1,285 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+# Lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Window after which per-user grant counts (used for fair sharing) are reset
+FAIRNESS_WINDOW_SECONDS = 60.0
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be scheduled within its maximum wait."""
+
+    def __init__(self, budget: str, retry_after: float):
+        self.budget = budget
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit for '{budget}' exceeded, retry after {retry_after:.1f}s")
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RequestExceedsBudget(Exception):
+    """Raised when a single request needs more than a whole minute of the budget."""
+
+    def __init__(self, budget: str, amount: int, limit: int, unit: str = "tokens"):
+        self.budget = budget
+        self.amount = amount
+        self.limit = limit
+        super().__init__(
+            f"Request needs {amount} '{budget}' {unit} but the limit is {limit} per minute"
+        )
+
+
+class _Budget:
+    """Requests-per-minute and tokens-per-minute token buckets for one model."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def delay(self, requests: int, tokens: int) -> float:
+        """Seconds until the bucket can serve the given demand (0 if it can now)."""
+        self.refill()
+        missing_requests = max(0.0, requests - self.requests)
+        missing_tokens = max(0.0, tokens - self.tokens)
+        return max(missing_requests * 60 / self.rpm, missing_tokens * 60 / self.tpm)
+
+    def take(self, requests: int, tokens: int):
+        self.requests -= requests
+        self.tokens -= tokens
+
+
+class _Waiter:
+    def __init__(self, user_id: str, requests: int, tokens: int, future: asyncio.Future):
+        self.user_id = user_id
+        self.requests = requests
+        self.tokens = tokens
+        self.future = future
+
+
+class LLMScheduler:
+    """Shared scheduler that keeps provider calls within per-model rate limits.
+
+    Each budget (e.g. "chat", "embedding") has its own request/token buckets
+    and a priority queue. Within the same priority, users with fewer requests
+    granted or queued in the current window are served first.
+    """
+
+    def __init__(self, budgets: Dict[str, Tuple[int, int]], max_wait: float):
+        self.max_wait = max_wait
+        self._budgets = {name: _Budget(rpm, tpm) for name, (rpm, tpm) in budgets.items()}
+        self._queues: Dict[str, List] = {name: [] for name in budgets}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._grants: Dict[str, Dict[str, int]] = {name: {} for name in budgets}
+        self._window_start = time.monotonic()
+        self._seq = itertools.count()
+
+    def capacity(self, budget: str) -> Optional[Tuple[int, int]]:
+        """(requests, tokens) per minute of a budget, or None if it is not limited."""
+        bucket = self._budgets.get(budget)
+        if bucket is None:
+            return None
+        return bucket.rpm, bucket.tpm
+
+    def _user_share(self, budget: str, user_id: str) -> int:
+        """Requests granted to or queued by a user in the current fairness window."""
+        if time.monotonic() - self._window_start > FAIRNESS_WINDOW_SECONDS:
+            self._window_start = time.monotonic()
+            for grants in self._grants.values():
+                grants.clear()
+        queued = sum(
+            1 for entry in self._queues[budget]
+            if entry[-1].user_id == user_id and not entry[-1].future.done()
+        )
+        return self._grants[budget].get(user_id, 0) + queued
+
+    def _grant(self, budget: str, waiter: _Waiter):
+        self._budgets[budget].take(waiter.requests, waiter.tokens)
+        grants = self._grants[budget]
+        grants[waiter.user_id] = grants.get(waiter.user_id, 0) + 1
+
+    def _estimate_wait(self, budget: str, rank: Tuple[int, int], requests: int, tokens: int) -> float:
+        """Time until the bucket could serve this demand plus everything queued ahead of it."""
+        bucket = self._budgets[budget]
+        for entry in self._queues[budget]:
+            waiter = entry[-1]
+            if entry[:2] <= rank and not waiter.future.done():
+                requests += waiter.requests
+                tokens += waiter.tokens
+        bucket.refill()
+        missing_requests = max(0.0, requests - bucket.requests)
+        missing_tokens = max(0.0, tokens - bucket.tokens)
+        return max(missing_requests * 60 / bucket.rpm, missing_tokens * 60 / bucket.tpm)
+
+    def _dispatch(self, budget: str):
+        """Grant queued waiters in priority order while the bucket allows it."""
+        timer = self._timers.pop(budget, None)
+        if timer is not None:
+            timer.cancel()
+
+        bucket = self._budgets[budget]
+        queue = self._queues[budget]
+        while queue:
+            waiter = queue[0][-1]
+            if waiter.future.done():
+                # Timed out or cancelled while queued
+                heapq.heappop(queue)
+                continue
+            delay = bucket.delay(waiter.requests, waiter.tokens)
+            if delay > 0:
+                loop = waiter.future.get_loop()
+                self._timers[budget] = loop.call_later(delay, self._dispatch, budget)
+                return
+            heapq.heappop(queue)
+            self._grant(budget, waiter)
+            waiter.future.set_result(None)
+
+    async def acquire(
+        self,
+        budget: str,
+        tokens: int,
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: str = "anonymous",
+        requests: int = 1,
+        max_wait: Optional[float] = None
+    ):
+        """Wait until the budget can serve the call, or raise RateLimitExceeded.
+
+        Requests that would wait longer than max_wait are rejected immediately
+        with an estimated retry time instead of being queued. Requests larger
+        than the whole per-minute budget raise RequestExceedsBudget; callers
+        split such work into smaller requests.
+        """
+        if budget not in self._budgets:
+            return
+        max_wait = self.max_wait if max_wait is None else max_wait
+        bucket = self._budgets[budget]
+        if tokens > bucket.tpm:
+            raise RequestExceedsBudget(budget, tokens, bucket.tpm)
+        if requests > bucket.rpm:
+            raise RequestExceedsBudget(budget, requests, bucket.rpm, unit="requests")
+        queue = self._queues[budget]
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(user_id, requests, tokens, future)
+
+        has_pending = any(not entry[-1].future.done() for entry in queue)
+        if not has_pending and bucket.delay(requests, tokens) == 0:
+            self._grant(budget, waiter)
+            return
+
+        rank = (priority, self._user_share(budget, user_id))
+        estimate = self._estimate_wait(budget, rank, requests, tokens)
+        if estimate > max_wait:
+            raise RateLimitExceeded(budget, estimate)
+
+        entry = rank + (next(self._seq), waiter)
+        heapq.heappush(queue, entry)
+        self._dispatch(budget)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                return
+            future.cancel()
+            raise RateLimitExceeded(budget, self._estimate_wait(budget, rank, requests, tokens))
+        except BaseException:
+            if not future.done():
+                future.cancel()
+            raise
+
+    def release(self, budget: str, tokens: int, user_id: str = "anonymous", requests: int = 1):
+        """Return capacity granted by acquire() for a call that was never made."""
+        bucket = self._budgets.get(budget)
+        if bucket is None:
+            return
+        bucket.refill()
+        bucket.requests = min(bucket.rpm, bucket.requests + requests)
+        bucket.tokens = min(bucket.tpm, bucket.tokens + tokens)
+        grants = self._grants[budget]
+        if grants.get(user_id):
+            grants[user_id] -= 1
+        if self._queues[budget]:
+            self._dispatch(budget)
+
+    async def acquire_many(
+        self,
+        demands: List[Tuple[str, int, int]],
+        priority: int = PRIORITY_INTERACTIVE,
+        user_id: str = "anonymous"
+    ):
+        """Acquire several (budget, tokens, requests) demands for one operation.
+
+        All or nothing: if any budget is rejected, what was already granted
+        for the others is released before the error propagates.
+        """
+        granted = []
+        try:
+            for budget, tokens, requests in demands:
+                await self.acquire(budget, tokens, priority=priority, user_id=user_id, requests=requests)
+                granted.append((budget, tokens, requests))
+        except BaseException:
+            for budget, tokens, requests in granted:
+                self.release(budget, tokens, user_id=user_id, requests=requests)
+            raise
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) used for scheduling."""
+    return len(text) // 4 + 1
+
+
+def request_user_id(request) -> str:
+    """Identify the caller for fair sharing (X-User-Id header, else client address)."""
+    user_id = request.headers.get("X-User-Id")
+    if user_id:
+        return user_id
+    return request.client.host if request.client else "anonymous"
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler, creating it from settings on first use."""
+    global _scheduler
+    if _scheduler is None:
+        # Each worker process enforces its share of the provider limits
+        workers = max(1, settings.WORKER_COUNT)
+        _scheduler = LLMScheduler(
+            budgets={
+                "chat": (
+                    max(1, settings.CHAT_RPM_LIMIT // workers),
+                    max(1, settings.CHAT_TPM_LIMIT // workers),
+                ),
+                "embedding": (
+                    max(1, settings.EMBEDDING_RPM_LIMIT // workers),
+                    max(1, settings.EMBEDDING_TPM_LIMIT // workers),
+                ),
+                "auxiliary": (
+                    max(1, settings.AUXILIARY_RPM_LIMIT // workers),
+                    max(1, settings.AUXILIARY_TPM_LIMIT // workers),
+                ),
+            },
+            max_wait=settings.RATE_LIMIT_MAX_WAIT_SECONDS,
+        )
+    return _scheduler
@@ -0,0 +1,41 @@
+import importlib
+import sys
+import time
+from typing import Dict, List, Sequence
+
+# Modules that are expensive to import and must not be loaded while the API
+# routers are imported. They are pulled in on first use (or during warm-up).
+HEAVY_MODULES: Sequence[str] = (
+    "chromadb",
+    "langchain_chroma",
+    "langchain_openai",
+    "langchain_community.document_loaders",
+    "pandas",
+    "pypdf",
+)
+
+
+def loaded_heavy_modules(modules: Sequence[str] = HEAVY_MODULES) -> List[str]:
+    """Return the heavy modules that are already present in sys.modules."""
+    return [name for name in modules if name in sys.modules]
+
+
+def profile_imports(modules: Sequence[str] = HEAVY_MODULES) -> Dict[str, float]:
+    """Import each module and return the time it took in milliseconds.
+
+    Modules that were already imported report 0.0; modules that are not
+    installed report -1.0.
+    """
+    report = {}
+    for name in modules:
+        if name in sys.modules:
+            report[name] = 0.0
+            continue
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            report[name] = -1.0
+            continue
+        report[name] = round((time.perf_counter() - start) * 1000, 1)
+    return report
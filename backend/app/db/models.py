@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -50,6 +50,36 @@ class Document(Base):
     owner = relationship("User", back_populates="documents")
     collection = relationship("Collection", back_populates="documents")
 
+class CanvasNode(Base):
+    """A Canvas conversation node as last ingested (used to embed only changes)."""
+    __tablename__ = "canvas_nodes"
+    __table_args__ = (UniqueConstraint("canvas_id", "node_id"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    canvas_id = Column(String, nullable=False, index=True)
+    node_id = Column(String, nullable=False)
+    parent_id = Column(String, nullable=True)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    content_hash = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class CanvasBranchSummary(Base):
+    """Rolling summary of the path from the root to node_id."""
+    __tablename__ = "canvas_branch_summaries"
+    __table_args__ = (UniqueConstraint("canvas_id", "node_id"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    canvas_id = Column(String, nullable=False, index=True)
+    node_id = Column(String, nullable=False)
+    summary = Column(Text, nullable=False)
+    path_hash = Column(String, nullable=False)  # Hash of the path content the summary covers
+    is_indexed = Column(Boolean, default=False, nullable=False)  # Summary vector is in the vector store
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class Conversation(Base):
     __tablename__ = "conversations"
     
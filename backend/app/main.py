@@ -1,13 +1,63 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.endpoints import documents, chat
+from app.core import index_sync
 from app.core.config import settings
+from app.core.startup import loaded_heavy_modules, profile_imports
 from app.db.database import engine, Base
 
-# Create Tables
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json")
+def _warm_up(report: dict):
+    """Load heavy dependencies and open the vector store ahead of the first request."""
+    from app.core.rag.vector_store import get_vector_store_manager
+
+    start = time.perf_counter()
+    try:
+        if settings.STARTUP_PROFILE:
+            report["import_ms"] = profile_imports()
+        get_vector_store_manager()
+    except Exception as e:
+        # The store is created again on first use; surface why warm-up failed
+        report["warmup_error"] = repr(e)
+        print(f"Warning: Vector store warm-up failed: {e!r}")
+        return
+    report["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    report = {"heavy_modules_at_startup": loaded_heavy_modules()}
+    app.state.startup_report = report
+
+    # Create Tables (one worker at a time in multi-worker mode)
+    start = time.perf_counter()
+    if settings.MULTI_WORKER:
+        with index_sync.exclusive_lock("startup.lock"):
+            Base.metadata.create_all(bind=engine)
+    else:
+        Base.metadata.create_all(bind=engine)
+    report["create_tables_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        # Run in the background so /health answers while the store is loading
+        warmup_task = asyncio.create_task(asyncio.to_thread(_warm_up, report))
+
+    yield
+
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+
+
+app = FastAPI(
+    title=settings.PROJECT_NAME,
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
+)
 
 # CORS
 origins = [
@@ -30,3 +80,8 @@ app.include_router(chat.router, prefix=f"{settings.API_V1_STR}/chat", tags=["cha
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/health/startup")
+def startup_report():
+    """Import-time and warm-up profile collected during application startup."""
+    return app.state.startup_report
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Point every data path at a throwaway directory before the app (and its
+# settings) are imported, and make sure no real provider key is used.
+_DATA_DIR = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DATA_DIR}/app.db"
+os.environ["CHROMA_PERSIST_DIRECTORY"] = os.path.join(_DATA_DIR, "chroma_db")
+os.environ["TABULAR_DB_PATH"] = os.path.join(_DATA_DIR, "tables.db")
+os.environ["INDEX_SYNC_DIRECTORY"] = os.path.join(_DATA_DIR, "index_sync")
+os.environ["OPENAI_API_KEY"] = "sk-test"
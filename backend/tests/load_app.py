@@ -0,0 +1,26 @@
+"""App for the multi-worker load test, with the OpenAI clients replaced by local fakes.
+
+Served by `uvicorn tests.load_app:app --workers N` from backend/. Every worker
+imports this module, so /chat/query goes through the real replica, retrieval
+and streaming path without calling the provider.
+"""
+import langchain_openai
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+ANSWER = "부하 테스트 답변"
+
+
+def _chat_model(**kwargs):
+    return FakeListChatModel(responses=[ANSWER])
+
+
+def _embeddings(**kwargs):
+    return DeterministicFakeEmbedding(size=256)
+
+
+# Patched before the app is imported: rag_chain binds ChatOpenAI at import time
+langchain_openai.ChatOpenAI = _chat_model
+langchain_openai.OpenAIEmbeddings = _embeddings
+
+from app.main import app  # noqa: E402,F401
@@ -0,0 +1,215 @@
+import itertools
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+
+from app.api.endpoints import documents as documents_endpoint
+from app.core import rate_limiter
+from app.core.config import settings
+from app.core.rag.conversation_ingest import ConversationIngestor
+from app.core.rate_limiter import PRIORITY_BULK, estimate_tokens
+from app.db import models
+from app.db.database import SessionLocal, engine
+from app.main import app
+
+
+class StubLLM:
+    def __init__(self):
+        self.prompts = []
+        self.fail = False
+        self._ids = itertools.count(1)
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("provider unavailable")
+        return AIMessage(content=f"요약 {next(self._ids)}")
+
+
+@pytest.fixture
+def canvas():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    canvas_id = uuid.uuid4().hex
+    document = models.Document(
+        user_id=1, filename="canvas", original_filename="canvas", file_path=f"canvas://{canvas_id}",
+        file_type="application/x-canvas-conversation", file_size=0
+    )
+    db.add(document)
+    db.commit()
+    yield db, document, canvas_id
+    db.close()
+
+
+async def _ingest(canvas, llm, nodes=(), deleted=()):
+    """One ingest round; returns (node ids embedded, summary node ids added, summary node ids removed)."""
+    db, document, canvas_id = canvas
+    ingestor = ConversationIngestor(db, document, canvas_id, "canvas")
+    ingestor.apply_changes(
+        [{"id": n, "parent_id": p, "role": "user", "content": f"{n} 메시지"} for n, p in nodes],
+        list(deleted)
+    )
+    if ingestor.stale_summaries():
+        await ingestor.update_summaries(llm)
+    docs = ingestor.build_documents()
+    removed = set()
+    for where in ingestor.stale_vector_filters():
+        source_type, node_filter = where["$and"][1]["source_type"], where["$and"][2]["node_id"]
+        if source_type == "canvas_summary":
+            removed |= set(node_filter["$in"])
+    ingestor.mark_indexed()
+    db.commit()
+    embedded = {d.metadata["node_id"] for d in docs if d.metadata["source_type"] == "canvas_node"}
+    added = {d.metadata["node_id"] for d in docs if d.metadata["source_type"] == "canvas_summary"}
+    return embedded, added, removed, ingestor
+
+
+async def test_leaf_append_extends_previous_summary(canvas):
+    llm = StubLLM()
+    embedded, added, removed, ingestor = await _ingest(canvas, llm, [("a", None), ("b", "a"), ("c", "b")])
+    assert embedded == {"a", "b", "c"}
+    assert (added, removed) == ({"c"}, set())
+    assert ingestor.vector_count() == 4
+
+    embedded, added, removed, _ = await _ingest(canvas, llm, [("d", "c")])
+    assert embedded == {"d"}
+    assert (added, removed) == ({"d"}, {"c"})
+    # Only the new message is sent, on top of c's summary
+    assert "요약 1" in llm.prompts[-1]
+    assert "c 메시지" not in llm.prompts[-1] and "d 메시지" in llm.prompts[-1]
+
+
+async def test_new_branch_is_summarized_from_the_branch_point(canvas):
+    llm = StubLLM()
+    await _ingest(canvas, llm, [("a", None), ("b", "a"), ("c", "b")])
+
+    embedded, added, removed, _ = await _ingest(canvas, llm, [("e", "b")])
+
+    assert embedded == {"e"}
+    # b became a branch point: summarized first, then e extends it
+    branch_prompt, leaf_prompt = llm.prompts[-2:]
+    assert "b 메시지" in branch_prompt
+    assert "e 메시지" in leaf_prompt and "b 메시지" not in leaf_prompt
+    assert (added, removed) == ({"e"}, set())  # c keeps its summary vector
+
+
+async def test_failed_summary_keeps_parent_vector_and_is_retried(canvas):
+    llm = StubLLM()
+    await _ingest(canvas, llm, [("a", None), ("b", "a")])
+
+    llm.fail = True
+    embedded, added, removed, _ = await _ingest(canvas, llm, [("c", "b")])
+    assert embedded == {"c"}
+    assert (added, removed) == (set(), set())  # b's summary stays searchable
+
+    # Nothing changed, but the stale summary is retried
+    llm.fail = False
+    embedded, added, removed, _ = await _ingest(canvas, llm)
+    assert embedded == set()
+    assert (added, removed) == ({"c"}, {"b"})
+
+
+async def test_deleting_a_leaf_restores_parent_summary_vector(canvas):
+    llm = StubLLM()
+    await _ingest(canvas, llm, [("a", None), ("b", "a")])
+    await _ingest(canvas, llm, [("c", "b")])
+    prompts = len(llm.prompts)
+
+    embedded, added, removed, ingestor = await _ingest(canvas, llm, deleted=["c"])
+
+    assert len(llm.prompts) == prompts  # b's stored summary is still valid
+    assert (added, removed) == ({"b"}, {"c"})
+    assert ingestor.vector_count() == 3
+
+
+async def test_long_first_ingest_is_folded_in_bounded_segments(canvas):
+    db, document, canvas_id = canvas
+    llm = StubLLM()
+    ingestor = ConversationIngestor(db, document, canvas_id, "canvas")
+    ingestor.apply_changes([
+        {"id": f"n{i}", "parent_id": f"n{i - 1}" if i else None, "role": "user", "content": f"n{i} " + "x" * 2500}
+        for i in range(60)
+    ], [])
+
+    await ingestor.update_summaries(llm)
+
+    # ~38k tokens of messages, never sent in one prompt
+    assert len(llm.prompts) > 1
+    assert all(
+        estimate_tokens(prompt) < settings.CONVERSATION_SUMMARY_MAX_TOKENS + 500 for prompt in llm.prompts
+    )
+    assert ingestor.summaries["n59"].summary == f"요약 {len(llm.prompts)}"
+    # Intermediate summaries are kept at interior nodes but only the leaf's is searchable
+    assert len(ingestor.summaries) == len(llm.prompts)
+    ingestor.mark_indexed()
+    assert ingestor.vector_count() == 60 + 1
+
+
+async def test_failed_fold_resumes_from_the_last_intermediate_summary(canvas, monkeypatch):
+    monkeypatch.setattr(settings, "CONVERSATION_SUMMARY_MAX_TOKENS", 5)  # one message per segment
+    llm = StubLLM()
+    calls = 0
+
+    async def acquire(prompt):
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            raise RuntimeError("budget exhausted")
+
+    db, document, canvas_id = canvas
+    ingestor = ConversationIngestor(db, document, canvas_id, "canvas")
+    ingestor.apply_changes(
+        [{"id": n, "parent_id": p, "role": "user", "content": f"{n} 메시지"} for n, p in
+         [("a", None), ("b", "a"), ("c", "b"), ("d", "c")]],
+        []
+    )
+    await ingestor.update_summaries(llm, acquire)
+    db.commit()
+    assert ingestor.stale_summaries() == ["d"]
+
+    prompts = len(llm.prompts)
+    embedded, added, removed, _ = await _ingest(canvas, llm)
+    # Resumes from b's intermediate summary instead of the root
+    assert "요약 2" in llm.prompts[prompts]
+    assert "b 메시지" not in llm.prompts[prompts] and "c 메시지" in llm.prompts[prompts]
+    assert added == {"d"}
+
+
+def test_ingest_endpoint_reserves_bulk_budget_and_counts_vectors(monkeypatch):
+    import langchain_openai
+
+    llm = StubLLM()
+    monkeypatch.setattr(langchain_openai, "ChatOpenAI", lambda **kwargs: llm)
+    monkeypatch.setattr(documents_endpoint, "_index_documents", lambda *args, **kwargs: None)
+    grants = []
+    scheduler = rate_limiter.LLMScheduler(
+        {"chat": (100, 100000), "auxiliary": (100, 100000), "embedding": (100, 100000)}, max_wait=1.0
+    )
+    original_acquire = scheduler.acquire
+
+    async def acquire(budget, tokens, priority=0, **kwargs):
+        grants.append((budget, priority))
+        await original_acquire(budget, tokens, priority=priority, **kwargs)
+
+    monkeypatch.setattr(scheduler, "acquire", acquire)
+    monkeypatch.setattr(rate_limiter, "_scheduler", scheduler)
+
+    canvas_id = uuid.uuid4().hex
+    nodes = [
+        {"id": "a", "parent_id": None, "type": "user", "content": "x" * 9000},
+        {"id": "b", "parent_id": "a", "type": "assistant", "content": "답변"},
+    ]
+    with TestClient(app) as client:
+        body = client.post(
+            "/api/v1/documents/conversations/ingest", json={"canvas_id": canvas_id, "nodes": nodes}
+        ).json()
+        listed = {doc["id"]: doc for doc in client.get("/api/v1/documents/").json()}
+
+    # Summaries run on the auxiliary model, not the chat model's budget
+    assert ("auxiliary", PRIORITY_BULK) in grants
+    assert "chat" not in {budget for budget, _ in grants}
+    assert ("embedding", PRIORITY_BULK) in grants
+    assert body["vectors_added"] == 5  # 3 chunks of a, 1 of b, b's summary
+    assert listed[body["id"]]["chunk_count"] == 5
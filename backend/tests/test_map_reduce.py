@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.core.config import settings
+from app.core.rag.rag_chain import RAGChain
+
+DOCUMENT_IDS = [1, 2, 3, 4]
+CHUNKS_PER_DOCUMENT = 6
+SECONDS_PER_KILOCHAR = 0.01
+
+
+def _doc(document_id, chunk_id):
+    return Document(
+        page_content=f"{document_id}번 파일의 {chunk_id}번째 청크 " + "내용 " * 300,
+        metadata={
+            "document_id": document_id,
+            "filename": f"file{document_id}.pdf",
+            "source": f"./data/documents/file{document_id}.pdf",
+            "chunk_id": chunk_id,
+        },
+    )
+
+
+ALL_DOCS = [_doc(d, c) for c in range(CHUNKS_PER_DOCUMENT) for d in DOCUMENT_IDS]
+
+
+class StubVectorStore:
+    """Vector store stub that honours the document_id filter."""
+
+    def __init__(self):
+        self.filters = []
+
+    async def aembed_queries(self, queries):
+        return [[0.0] for _ in queries]
+
+    async def asearch_by_vector(self, embedding, k=4, filter=None):
+        self.filters.append(filter)
+        docs = ALL_DOCS
+        if filter:
+            docs = [doc for doc in docs if doc.metadata["document_id"] == filter["document_id"]]
+        return docs[:k]
+
+
+class StubLLM:
+    """Chat model stub whose latency grows with the prompt length, like a real provider."""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    async def _call(self, prompt):
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(len(text) / 1000 * SECONDS_PER_KILOCHAR)
+        finally:
+            self.active -= 1
+        return AIMessage(content="부분 답변")
+
+    def runnable(self):
+        return RunnableLambda(self._call)
+
+
+def _chain(store, retriever_docs):
+    stub = StubLLM()
+    chain = RAGChain(RunnableLambda(lambda query: retriever_docs), store)
+    chain.llm = stub.runnable()
+    return chain, stub
+
+
+async def _drain(stream):
+    return "".join([chunk async for chunk in stream])
+
+
+async def test_map_reduce_retrieves_per_document_and_cites_kept_groups(monkeypatch):
+    monkeypatch.setattr(settings, "MAP_REDUCE_MAX_GROUPS", 3)
+    monkeypatch.setattr(settings, "MAP_REDUCE_K_PER_GROUP", 2)
+    store = StubVectorStore()
+    chain, _ = _chain(store, ALL_DOCS)
+
+    answer = await _drain(chain.astream_answer_map_reduce("파일들을 비교해줘"))
+
+    assert store.filters[0] is None  # discovery search
+    assert store.filters[1:] == [{"document_id": d} for d in DOCUMENT_IDS[:3]]
+    assert "file4.pdf" not in answer  # dropped group is not cited
+    for document_id in DOCUMENT_IDS[:3]:
+        assert f"file{document_id}.pdf" in answer
+
+
+async def test_map_reduce_only_searches_requested_documents(monkeypatch):
+    store = StubVectorStore()
+    chain, _ = _chain(store, ALL_DOCS)
+
+    await _drain(chain.astream_answer_map_reduce("비교", document_ids=[4, 2]))
+
+    assert store.filters == [{"document_id": 4}, {"document_id": 2}]
+
+
+async def test_map_reduce_is_faster_than_single_call_over_same_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "MAP_REDUCE_K_PER_GROUP", CHUNKS_PER_DOCUMENT)
+    monkeypatch.setattr(settings, "MAP_REDUCE_MAX_GROUPS", len(DOCUMENT_IDS))
+    monkeypatch.setattr(settings, "MAP_REDUCE_CONCURRENCY", 2)
+    monkeypatch.setattr(settings, "MAP_REDUCE_TOKEN_BUDGET", 100000)
+
+    single_chain, _ = _chain(StubVectorStore(), ALL_DOCS)
+    started = time.perf_counter()
+    await _drain(single_chain.astream_answer_with_history("파일들을 비교해줘"))
+    single_seconds = time.perf_counter() - started
+
+    map_reduce_chain, stub = _chain(StubVectorStore(), ALL_DOCS)
+    started = time.perf_counter()
+    await _drain(map_reduce_chain.astream_answer_map_reduce("파일들을 비교해줘"))
+    map_reduce_seconds = time.perf_counter() - started
+
+    print(f"single call: {single_seconds:.3f}s, map-reduce: {map_reduce_seconds:.3f}s")
+    assert stub.max_active == 2  # map calls bounded by MAP_REDUCE_CONCURRENCY
+    assert map_reduce_seconds < single_seconds
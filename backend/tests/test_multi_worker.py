@@ -0,0 +1,153 @@
+import asyncio
+import gc
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Tuple
+
+import httpx
+import pytest
+
+from app.core import index_sync
+from app.core.config import settings
+from app.core.rag import vector_store
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def test_replica_reload_runs_off_the_event_loop_and_stops_old_system(monkeypatch):
+    monkeypatch.setattr(settings, "MULTI_WORKER", True)
+    monkeypatch.setattr(vector_store, "_vector_store_manager", None)
+    loaded_in = []
+
+    class RecordingManager(vector_store.VectorStoreManager):
+        def __init__(self):
+            loaded_in.append(threading.get_ident())
+            super().__init__()
+
+    monkeypatch.setattr(vector_store, "VectorStoreManager", RecordingManager)
+
+    first = await vector_store.aget_vector_store_manager()
+    assert await vector_store.aget_vector_store_manager() is first  # version unchanged
+    old_system = first._client._system
+
+    index_sync.bump_version()  # another worker wrote to the index
+    second = await vector_store.aget_vector_store_manager()
+
+    assert second is not first
+    assert threading.get_ident() not in loaded_in
+    # A request still holding the old replica keeps a running system
+    assert old_system._running
+    del first
+    gc.collect()
+    assert not old_system._running
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _ingest_body(turns: int) -> dict:
+    nodes = [
+        {"id": f"n{i}", "parent_id": f"n{i - 1}" if i else None, "content": f"환불 규정 {i}번째 메시지"}
+        for i in range(turns)
+    ]
+    return {"canvas_id": "load-test", "nodes": nodes}
+
+
+async def _throughput(workers: int, seconds: float = 5.0, concurrency: int = 32) -> Tuple[float, int]:
+    """(queries per second, index writes) for a uvicorn instance with the given worker count.
+
+    Readers hit /chat/query in multi_query mode, which goes through the
+    worker's Chroma replica, while a writer keeps ingesting a Canvas so
+    every worker has to notice the version bump and reload mid-run.
+    """
+    port = _free_port()
+    data_dir = tempfile.mkdtemp(prefix="rag-load-")
+    sync_dir = os.path.join(data_dir, "index_sync")
+    env = {
+        **os.environ,
+        "MULTI_WORKER": "true",
+        "WORKER_COUNT": str(workers),
+        "DATABASE_URL": f"sqlite:///{data_dir}/app.db",
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(data_dir, "chroma_db"),
+        "TABULAR_DB_PATH": os.path.join(data_dir, "tables.db"),
+        "INDEX_SYNC_DIRECTORY": sync_dir,
+        # Measure the server, not the provider budgets
+        "CHAT_RPM_LIMIT": "10000000",
+        "CHAT_TPM_LIMIT": "1000000000",
+        "AUXILIARY_RPM_LIMIT": "10000000",
+        "AUXILIARY_TPM_LIMIT": "1000000000",
+        "EMBEDDING_RPM_LIMIT": "10000000",
+        "EMBEDDING_TPM_LIMIT": "1000000000",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "tests.load_app:app", "--port", str(port), "--workers", str(workers)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    query = {
+        "question": "환불 규정은?",
+        "chat_history": [{"role": "user", "content": "환불 문의드립니다"}],
+        "retrieval_mode": "multi_query",
+    }
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            for _ in range(100):
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+            (await client.post("/api/v1/documents/conversations/ingest", json=_ingest_body(1))).raise_for_status()
+            served = 0
+            deadline = time.monotonic() + seconds
+
+            async def hammer():
+                nonlocal served
+                while time.monotonic() < deadline:
+                    response = await client.post("/api/v1/chat/query", json=query)
+                    response.raise_for_status()
+                    assert "부하 테스트 답변" in response.text  # tests/load_app.py fake model
+                    served += 1
+
+            async def write():
+                turns = 1
+                while time.monotonic() < deadline:
+                    turns += 1
+                    response = await client.post(
+                        "/api/v1/documents/conversations/ingest", json=_ingest_body(turns)
+                    )
+                    response.raise_for_status()
+                    await asyncio.sleep(0.25)
+
+            await asyncio.gather(write(), *[hammer() for _ in range(concurrency)])
+        with open(os.path.join(sync_dir, "index.version")) as f:
+            writes = int(f.read())
+        return served / seconds, writes
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@pytest.mark.skipif(
+    not os.environ.get("RUN_LOAD_TESTS") or (os.cpu_count() or 1) < 2,
+    reason="load test: set RUN_LOAD_TESTS=1 on a machine with 2+ CPUs"
+)
+async def test_throughput_scales_from_one_to_n_workers():
+    workers = min(4, os.cpu_count())
+    single, _ = await _throughput(1)
+    multi, writes = await _throughput(workers)
+    print(f"1 worker: {single:.0f} req/s, {workers} workers: {multi:.0f} req/s, {writes} index writes")
+    # Replicas were reloaded under load, not served from a frozen snapshot
+    assert writes > 1
+    assert multi > single * 1.3
@@ -0,0 +1,184 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+from app.api.endpoints.documents import _embedding_batches
+from app.core import rate_limiter
+from app.core.rate_limiter import (
+    PRIORITY_BULK, PRIORITY_INTERACTIVE, LLMScheduler, RateLimitExceeded, RequestExceedsBudget
+)
+from app.main import app
+
+
+class MockProvider:
+    """Provider that enforces its own request limit (token bucket) and rejects excess calls with 429."""
+
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self.available = float(rpm) / 60  # burst of one second worth of requests
+        self.updated = time.monotonic()
+        self.accepted = 0
+        self.rejected = 0
+
+    async def call(self):
+        now = time.monotonic()
+        self.available = min(self.rpm / 60, self.available + (now - self.updated) * self.rpm / 60)
+        self.updated = now
+        if self.available < 1 - 1e-6:
+            self.rejected += 1
+            raise RuntimeError("429 Too Many Requests")
+        self.available -= 1
+        self.accepted += 1
+
+
+def _drained(rpm=600, tpm=600000, max_wait=5.0):
+    """Scheduler whose chat bucket starts empty, so every call has to queue."""
+    scheduler = LLMScheduler({"chat": (rpm, tpm)}, max_wait=max_wait)
+    scheduler._budgets["chat"].requests = 0
+    return scheduler
+
+
+async def test_interactive_requests_overtake_queued_bulk_work():
+    scheduler = _drained()
+    order = []
+
+    async def job(name, priority, user_id):
+        await scheduler.acquire("chat", 10, priority=priority, user_id=user_id)
+        order.append(name)
+
+    bulk = [asyncio.create_task(job(f"bulk{i}", PRIORITY_BULK, "ingest")) for i in range(3)]
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(job("interactive", PRIORITY_INTERACTIVE, "alice"))
+    await asyncio.gather(*bulk, interactive)
+
+    assert order[0] == "interactive"
+    assert order[1:] == ["bulk0", "bulk1", "bulk2"]
+
+
+async def test_users_with_fewer_requests_are_served_first():
+    scheduler = _drained()
+    order = []
+
+    async def job(name, user_id):
+        await scheduler.acquire("chat", 10, user_id=user_id)
+        order.append(name)
+
+    heavy = [asyncio.create_task(job(f"heavy{i}", "heavy")) for i in range(3)]
+    await asyncio.sleep(0)
+    light = asyncio.create_task(job("light", "light"))
+    await asyncio.gather(*heavy, light)
+
+    assert order.index("light") <= 1
+
+
+async def test_scheduled_calls_never_trip_the_provider_limit():
+    provider = MockProvider(rpm=300)
+    scheduler = LLMScheduler({"chat": (300, 100000)}, max_wait=5.0)
+    # Same burst allowance as the provider: one second worth of requests
+    scheduler._budgets["chat"].requests = 5
+
+    async def call(i):
+        await scheduler.acquire("chat", 1, user_id=f"user{i % 3}")
+        await provider.call()
+
+    await asyncio.gather(*[call(i) for i in range(15)])
+    assert (provider.accepted, provider.rejected) == (15, 0)
+
+    # Without the scheduler the same burst is rejected by the provider
+    await asyncio.gather(*[provider.call() for _ in range(15)], return_exceptions=True)
+    assert provider.rejected > 0
+
+
+async def test_rejects_when_wait_exceeds_max_wait():
+    scheduler = _drained(rpm=60, max_wait=0.5)
+
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        await scheduler.acquire("chat", 10)
+
+    assert excinfo.value.retry_after == pytest.approx(1.0, abs=0.1)
+    assert excinfo.value.retry_after_header == "1"
+
+
+async def test_requests_larger_than_budget_are_rejected_not_clamped():
+    scheduler = LLMScheduler({"chat": (100, 1000)}, max_wait=5.0)
+
+    with pytest.raises(RequestExceedsBudget):
+        await scheduler.acquire("chat", 1001)
+    # The bucket was not touched by the rejected request
+    assert scheduler._budgets["chat"].tokens == pytest.approx(1000, abs=1)
+
+
+def test_chat_endpoint_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_scheduler", _drained(rpm=6, max_wait=0.1))
+    with TestClient(app) as client:
+        response = client.post("/api/v1/chat/query", json={"question": "q"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_chat_endpoint_returns_413_for_map_reduce_over_budget(monkeypatch):
+    scheduler = LLMScheduler({"chat": (100, 5000), "embedding": (100, 100000)}, max_wait=1.0)
+    monkeypatch.setattr(rate_limiter, "_scheduler", scheduler)
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/chat/query", json={"question": "q", "answer_mode": "map_reduce"}
+        )
+
+    assert response.status_code == 413
+
+
+def test_query_embeddings_reserve_interactive_budget(monkeypatch):
+    scheduler = LLMScheduler({"chat": (100, 100000), "embedding": (2, 100000)}, max_wait=0.1)
+    scheduler._budgets["embedding"].requests = 0
+    monkeypatch.setattr(rate_limiter, "_scheduler", scheduler)
+    with TestClient(app) as client:
+        response = client.post("/api/v1/chat/query", json={"question": "q"})
+
+    assert response.status_code == 429
+    assert "embedding" in response.json()["detail"]
+    # The chat tokens reserved before the embedding rejection were returned
+    assert scheduler._budgets["chat"].tokens == pytest.approx(100000, abs=1)
+    assert scheduler._budgets["chat"].requests == pytest.approx(100, abs=0.1)
+
+
+def test_multi_query_rewrite_reserves_auxiliary_budget(monkeypatch):
+    scheduler = LLMScheduler(
+        {"chat": (100, 100000), "auxiliary": (1, 100000), "embedding": (100, 100000)}, max_wait=0.1
+    )
+    scheduler._budgets["auxiliary"].requests = 0
+    monkeypatch.setattr(rate_limiter, "_scheduler", scheduler)
+    body = {
+        "question": "그건 왜?",
+        "chat_history": [{"role": "user", "content": "환불 규정"}],
+        "retrieval_mode": "multi_query",
+    }
+    with TestClient(app) as client:
+        response = client.post("/api/v1/chat/query", json=body)
+
+    assert response.status_code == 429
+    assert "auxiliary" in response.json()["detail"]
+    assert scheduler._budgets["chat"].tokens == pytest.approx(100000, abs=1)
+
+
+async def test_acquire_many_releases_earlier_grants_on_rejection():
+    scheduler = LLMScheduler({"chat": (100, 1000), "embedding": (100, 1000)}, max_wait=0.1)
+
+    with pytest.raises(RequestExceedsBudget):
+        await scheduler.acquire_many([("chat", 600, 1), ("embedding", 5000, 1)], user_id="alice")
+
+    assert scheduler._budgets["chat"].tokens == pytest.approx(1000, abs=1)
+    assert scheduler._user_share("chat", "alice") == 0
+
+
+def test_upload_embeddings_are_split_to_fit_the_token_budget(monkeypatch):
+    scheduler = LLMScheduler({"embedding": (100, 100)}, max_wait=1.0)
+    monkeypatch.setattr(rate_limiter, "_scheduler", scheduler)
+    docs = [Document(page_content="x" * 160) for _ in range(5)]  # ~41 tokens each
+
+    batches = _embedding_batches(docs)
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
@@ -0,0 +1,83 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.core.config import settings
+from app.core.rag.rag_chain import RAGChain
+from app.main import app
+
+
+class StubLLM:
+    def __init__(self, reply="재작성된 질의"):
+        self.reply = reply
+        self.prompts = []
+
+    async def ainvoke(self, prompt):
+        self.prompts.append(prompt)
+        return AIMessage(content=self.reply)
+
+
+class StubVectorStore:
+    def __init__(self, results, delay=0.0):
+        self.results = results
+        self.delay = delay
+        self.embed_calls = []
+
+    async def aembed_queries(self, queries):
+        self.embed_calls.append(list(queries))
+        await asyncio.sleep(self.delay)
+        return [[float(i)] for i in range(len(queries))]
+
+    async def asearch_by_vector(self, embedding, k=4, filter=None):
+        return self.results[int(embedding[0])][:k]
+
+
+def _doc(text, document_id=1):
+    return Document(page_content=text, metadata={"document_id": document_id, "source": "a.md"})
+
+
+def _chain(store, fallback_docs=None):
+    retriever = RunnableLambda(lambda query: fallback_docs or [_doc("fallback")])
+    chain = RAGChain(retriever, store)
+    chain.aux_llm = StubLLM()
+    return chain
+
+
+def test_invalid_modes_are_rejected():
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/chat/query", json={"question": "q", "retrieval_mode": "multi-query"}
+        )
+        assert response.status_code == 422
+        response = client.post(
+            "/api/v1/chat/query", json={"question": "q", "answer_mode": "mapreduce"}
+        )
+        assert response.status_code == 422
+
+
+async def test_multi_query_batches_embeddings_and_fuses_results(monkeypatch):
+    monkeypatch.setattr(settings, "MULTI_QUERY_HYDE", False)
+    shared = _doc("shared chunk")
+    store = StubVectorStore([[shared, _doc("raw only")], [_doc("rewrite only"), shared]])
+    chain = _chain(store)
+
+    history = [{"role": "user", "content": "이전 질문"}, {"role": "assistant", "content": "이전 답변"}]
+    docs = await chain.aretrieve("그건 왜죠?", history, "multi_query")
+
+    assert store.embed_calls == [["그건 왜죠?", "재작성된 질의"]]
+    contents = [doc.page_content for doc in docs]
+    assert contents[0] == "shared chunk"  # ranked by both sub-queries
+    assert sorted(contents) == sorted({"shared chunk", "raw only", "rewrite only"})
+
+
+async def test_multi_query_falls_back_to_single_query_on_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_TIMEOUT_SECONDS", 0.05)
+    store = StubVectorStore([[_doc("slow")], [_doc("slow")]], delay=1.0)
+    chain = _chain(store)
+
+    docs = await chain.aretrieve("q", [{"role": "user", "content": "h"}], "multi_query")
+
+    assert [doc.page_content for doc in docs] == ["fallback"]
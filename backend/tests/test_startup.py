@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.core.startup import HEAVY_MODULES
+from app.main import app, settings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_app_does_not_load_heavy_modules():
+    # A fresh interpreter: other tests in this session may already have imported them
+    code = (
+        "import json, sys, time; start = time.perf_counter(); import app.main; "
+        "elapsed = time.perf_counter() - start; "
+        f"print(json.dumps({{'loaded': [m for m in {list(HEAVY_MODULES)!r} if m in sys.modules], "
+        "'seconds': elapsed}))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    print(f"app.main import: {report['seconds'] * 1000:.0f} ms")
+    assert report["loaded"] == []
+
+
+def test_health_answers_and_reports_startup():
+    with TestClient(app) as client:
+        assert client.get("/health").json() == {"status": "healthy"}
+        report = client.get("/health/startup").json()
+    assert "create_tables_ms" in report
+
+
+def test_warmup_failure_is_reported(monkeypatch):
+    from app.core.rag import vector_store
+
+    def broken():
+        raise RuntimeError("chroma unavailable")
+
+    monkeypatch.setattr(settings, "WARMUP_ON_STARTUP", True)
+    monkeypatch.setattr(vector_store, "get_vector_store_manager", broken)
+    with TestClient(app) as client:
+        for _ in range(100):
+            report = client.get("/health/startup").json()
+            if "warmup_error" in report:
+                break
+    assert "chroma unavailable" in report["warmup_error"]
+    assert "warmup_ms" not in report
@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from app.core.rag import tabular_store
+from app.core.rag.rag_chain import RAGChain
+from app.core.rag.tabular_store import TabularStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TabularStore(str(tmp_path / "tables.db"))
+
+
+def _survey():
+    return pd.DataFrame({
+        "성별": ["남", "여", "여", "남", "여"],
+        "Q1": [1, 2, 2, 3, None],
+        "Q10": [5, 4, 4, 3, 2],
+        "나이": [20, 30, 40, 50, 60],
+    })
+
+
+def test_columns_differing_only_in_case_are_renamed(store):
+    frame = pd.DataFrame([[1, 2, 3]], columns=["Q1", "q1", "Q1"])
+    schema, = store.store_workbook(1, "survey.xlsx", {"Sheet1": frame})
+
+    assert [column["name"] for column in schema["columns"]] == ["Q1", "q1_1", "Q1_2"]
+    assert store.value_counts(schema["table_name"], "q1_1") == [{"value": 2, "count": 1}]
+
+
+def test_question_picks_grouped_aggregation(store):
+    schema, = store.store_workbook(1, "survey.xlsx", {"응답": _survey()})
+
+    result = store.answer_question(schema["table_name"], "성별에 따른 나이 평균은?")
+
+    assert "성별별 나이 avg" in result
+    assert "여 | 43.333" in result or "여 | 43.33333" in result
+
+
+def test_question_picks_value_counts_and_longest_column_name(store):
+    schema, = store.store_workbook(1, "survey.xlsx", {"응답": _survey()})
+
+    result = store.answer_question(schema["table_name"], "q10 응답 분포를 알려줘")
+
+    assert "Q10 값 분포" in result
+    assert "4 | 2" in result
+    assert store.answer_question(schema["table_name"], "전체 요약") == ""
+
+
+def test_profile_is_cached_until_table_is_replaced(store):
+    schema, = store.store_workbook(1, "survey.xlsx", {"응답": _survey()})
+    table = schema["table_name"]
+    first = store.profile(table)
+    assert store.profile(table) is first
+
+    store.store_workbook(1, "survey.xlsx", {"응답": _survey().head(2)})
+    assert "총 2행" in store.profile(table)
+
+    store.delete_by_document_id(1)
+    with pytest.raises(ValueError):
+        store.profile(table)
+
+
+async def test_tabular_context_includes_question_aggregation(store, monkeypatch):
+    store.store_workbook(7, "survey.xlsx", {"응답": _survey()})
+    monkeypatch.setattr(tabular_store, "_tabular_store", store)
+    chain = RAGChain(RunnableLambda(lambda query: []))
+    docs = [Document(
+        page_content="미리보기",
+        metadata={"document_id": 7, "sheet": "응답", "file_type": "excel"},
+    )]
+
+    context = await chain._tabular_context(docs, "성별 분포는?")
+
+    assert "총 5행" in context  # profile
+    assert "성별 값 분포" in context
+    assert "여 | 3" in context
+
+
+def test_profile_cache_sees_tables_replaced_by_another_worker(tmp_path):
+    path = str(tmp_path / "tables.db")
+    worker_a, worker_b = TabularStore(path), TabularStore(path)
+    schema, = worker_a.store_workbook(2, "old.xlsx", {"응답": _survey()})
+    assert "old.xlsx" in worker_a.profile(schema["table_name"])
+
+    # Worker B deletes document 2 and a new upload reuses the id (and table name)
+    worker_b.delete_by_document_id(2)
+    worker_b.store_workbook(2, "new.xlsx", {"응답": _survey().head(2)})
+
+    profile = worker_a.profile(schema["table_name"])
+    assert "new.xlsx" in profile and "총 2행" in profile
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import os
+import time
+import tracemalloc
+
+import httpx
+import pytest
+
+from app.api.endpoints import documents
+from app.core.config import settings
+from app.db import models
+from app.db.database import engine
+from app.main import app
+
+BOUNDARY = "test-boundary-7MA4YWxkTrZu0gW"
+CHUNK = 256 * 1024
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    models.Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(documents, "UPLOAD_DIR", str(tmp_path))
+    # Parsing and embedding are not under test here
+    monkeypatch.setattr(documents.UniversalDocumentLoader, "load_with_tables", lambda path: ([], {}))
+    monkeypatch.setattr(documents, "_index_documents", lambda *args, **kwargs: None)
+    return tmp_path
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def _multipart(filename: str, size: int, seed: bytes = b"x", pulled=None):
+    """Streamed multipart body (no Content-Length), generated chunk by chunk."""
+    async def body():
+        yield (
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            "Content-Type: text/plain\r\n\r\n"
+        ).encode()
+        sent = 0
+        while sent < size:
+            chunk = (seed * CHUNK)[:min(CHUNK, size - sent)]
+            sent += len(chunk)
+            if pulled is not None:
+                pulled.append(len(chunk))
+            yield chunk
+        yield f"\r\n--{BOUNDARY}--\r\n".encode()
+    return body()
+
+
+def _headers(**extra):
+    return {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}", **extra}
+
+
+async def test_concurrent_uploads_with_the_same_name_get_distinct_files(upload_dir):
+    seeds = [bytes([ord("a") + i]) for i in range(5)]
+    async with _client() as client:
+        responses = await asyncio.gather(*[
+            client.post("/api/v1/documents/upload", content=_multipart("report.txt", 300_000, seed), headers=_headers())
+            for seed in seeds
+        ])
+
+    assert [r.status_code for r in responses] == [200] * 5
+    names = {r.json()["filename"] for r in responses}
+    assert names == {"report.txt", "report_1.txt", "report_2.txt", "report_3.txt", "report_4.txt"}
+    for response in responses:
+        with open(upload_dir / response.json()["filename"], "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == response.json()["sha256"]
+    assert not [name for name in os.listdir(upload_dir) if name.endswith(".part")]
+
+
+async def test_streamed_upload_over_the_limit_is_rejected_and_cleaned_up(upload_dir, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE_BYTES", 100_000)
+    async with _client() as client:
+        response = await client.post(
+            "/api/v1/documents/upload", content=_multipart("big.txt", 500_000), headers=_headers()
+        )
+
+    assert response.status_code == 413
+    assert os.listdir(upload_dir) == []
+
+
+async def test_declared_oversized_upload_is_rejected_before_reading_the_body(upload_dir, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE_BYTES", 100_000)
+    pulled = []
+    async with _client() as client:
+        response = await client.post(
+            "/api/v1/documents/upload",
+            content=_multipart("big.txt", 5_000_000, pulled=pulled),
+            headers=_headers(**{"Content-Length": "5000200"}),
+        )
+
+    assert response.status_code == 413
+    assert sum(pulled) <= CHUNK  # body was not consumed
+
+
+async def test_concurrent_large_uploads_benchmark(upload_dir, monkeypatch):
+    """4 concurrent 16 MB uploads: reports throughput and checks memory stays bounded."""
+    monkeypatch.setattr(settings, "MAX_UPLOAD_SIZE_BYTES", 32 * 1024 * 1024)
+    size = 16 * 1024 * 1024
+    uploads = 4
+    tracemalloc.start()
+    started = time.perf_counter()
+    async with _client() as client:
+        responses = await asyncio.gather(*[
+            client.post("/api/v1/documents/upload", content=_multipart(f"large{i}.bin", size), headers=_headers())
+            for i in range(uploads)
+        ])
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert [r.status_code for r in responses] == [200] * uploads
+    assert all(r.json()["file_size"] == size for r in responses)
+    print(
+        f"{uploads} x {size // 2**20} MB: {uploads * size / 2**20 / seconds:.0f} MB/s, "
+        f"peak traced memory {peak / 2**20:.1f} MB"
+    )
+    # Bodies are streamed to disk, never held whole in memory
+    assert peak < size